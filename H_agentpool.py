@@ -0,0 +1,157 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from H_datahandle import datasets_fingerprint
+from H_supervisor import TyphoonAgent
+
+
+class AgentPool:
+    """A process-wide LRU pool of warm TyphoonAgent stacks with per-conversation memory."""
+
+    def __init__(self, max_agents: int = None, max_sessions: int = None):
+        """
+        Initialize the pool.
+
+        :param max_agents: How many agent stacks to keep warm before evicting the
+                           least recently used one (defaults to ``AGENT_POOL_SIZE`` or 4).
+        :param max_sessions: How many conversation memories each stack keeps before
+                             dropping the least recently used one (defaults to
+                             ``AGENT_POOL_SESSIONS`` or 200).
+        """
+        if max_agents is None:
+            max_agents = int(os.getenv("AGENT_POOL_SIZE", 4))
+        if max_sessions is None:
+            max_sessions = int(os.getenv("AGENT_POOL_SESSIONS", 200))
+        self.max_agents = max_agents
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()
+        # Stacks being built, so concurrent requests for one key wait for a single build
+        self._building = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(dataset_paths: dict, model_name: str, temperature: float, base_url: str) -> tuple:
+        """Build the pool key for a dataset set and model configuration."""
+        return (datasets_fingerprint(dataset_paths), model_name, float(temperature), base_url)
+
+    def acquire(
+        self,
+        dataset_paths: dict,
+        model_name: str,
+        temperature: float,
+        base_url: str,
+        user: str,
+        session=None,
+        router=None,
+    ) -> TyphoonAgent:
+        """
+        Return a warm agent for the given configuration, bound to the memory of one conversation.
+
+        The first call for a configuration builds the full stack (LLM clients,
+        prompt, datasets) without holding the pool lock; concurrent calls for
+        the same configuration wait for that build, and later calls reuse it.
+
+        :param dataset_paths: A dictionary of dataset keys to file paths.
+        :param model_name: The model to run all agents with.
+        :param temperature: The sampling temperature.
+        :param base_url: The OpenAI-compatible endpoint.
+        :param user: The user the conversation belongs to.
+        :param session: The chat session id; each ``(user, session)`` pair has its own memory.
+        :param router: A ModelRouter that picks each agent role's model (a single model if None).
+        :return: A TyphoonAgent sharing the pooled stack but using the conversation's memory.
+        """
+        key = self.make_key(dataset_paths, model_name, temperature, base_url)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return self._bind(entry, (user, session))
+                building = self._building.get(key)
+                owner = building is None
+                if owner:
+                    building = self._building[key] = Future()
+            if owner:
+                break
+            # Another request is building this stack; a failed build raises here too
+            building.result()
+
+        logging.info(f"Building agent stack for model {model_name} ({key[0][:12]}).")
+        try:
+            agent = TyphoonAgent(
+                temperature=temperature,
+                base_url=base_url,
+                model_name=model_name,
+                dataset_paths=dataset_paths,
+                router=router,
+            )
+        except BaseException as e:
+            with self._lock:
+                del self._building[key]
+            building.set_exception(e)
+            raise
+        with self._lock:
+            entry = {"agent": agent, "sessions": OrderedDict()}
+            self._entries[key] = entry
+            del self._building[key]
+            evicted = self._evict()
+            bound = self._bind(entry, (user, session))
+        building.set_result(None)
+        self._close(evicted)
+        return bound
+
+    def _bind(self, entry: dict, session_key: tuple) -> TyphoonAgent:
+        """Return the stack bound to a conversation's memory, creating it if needed (lock held)."""
+        sessions = entry["sessions"]
+        bound = sessions.get(session_key)
+        if bound is None:
+            agent = entry["agent"]
+            bound = sessions[session_key] = agent.bind_memory(agent.initialize_memory())
+            while len(sessions) > self.max_sessions:
+                sessions.popitem(last=False)
+        else:
+            sessions.move_to_end(session_key)
+        return bound
+
+    def release_session(self, user: str, session) -> None:
+        """Drop the memory of one conversation from every pooled stack."""
+        with self._lock:
+            for entry in self._entries.values():
+                entry["sessions"].pop((user, session), None)
+
+    def release_user(self, user: str) -> None:
+        """Drop every conversation memory of ``user`` from every pooled stack."""
+        with self._lock:
+            for entry in self._entries.values():
+                for session_key in [k for k in entry["sessions"] if k[0] == user]:
+                    del entry["sessions"][session_key]
+
+    def clear(self) -> None:
+        """Drop and close every pooled stack."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        self._close(entries)
+
+    def _evict(self) -> list:
+        """Pop the least recently used stacks beyond ``max_agents`` (lock held); the caller closes them."""
+        evicted = []
+        while len(self._entries) > self.max_agents:
+            key, entry = self._entries.popitem(last=False)
+            evicted.append(entry)
+            logging.info(f"Evicted agent stack for model {key[1]} ({key[0][:12]}).")
+        return evicted
+
+    @staticmethod
+    def _close(entries: list) -> None:
+        """Close popped stacks outside the pool lock so the registry can reclaim their datasets."""
+        for entry in entries:
+            try:
+                entry["agent"].close()
+            except Exception as e:
+                logging.warning(f"Could not close an evicted agent stack: {e}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
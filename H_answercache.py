@@ -0,0 +1,243 @@
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+# Words that do not change what a data question asks for
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "by", "per", "to", "and", "or", "is", "are",
+    "was", "were", "what", "which", "show", "me", "give", "tell", "please", "list", "get",
+    "find", "can", "you", "i", "we", "it", "this", "that", "all", "each", "every", "with",
+    "from", "as", "at", "be", "do", "does", "how", "much", "many", "there",
+}
+# Questions with fewer content words usually depend on the conversation ("and for 2015?")
+MIN_CONTENT_TOKENS = 2
+# Words that point back at the conversation ("what about Germany", "same for 2015"); such
+# questions mean different things in different chats, so they are never cached
+FOLLOW_UP_WORDS = {
+    "about", "also", "same", "again", "instead", "it", "its", "that", "those", "these", "them", "they",
+    "this", "previous", "earlier", "else", "other", "rest",
+}
+# Words that flip or direct what is asked; a fuzzy match must agree on them exactly and in order
+POLARITY_WORDS = {
+    "not", "no", "without", "excluding", "exclude", "except", "including", "include", "with",
+    "above", "below", "over", "under", "more", "less", "greater", "fewer", "higher", "lower", "than",
+    "ascending", "descending", "asc", "desc", "increase", "decrease", "increasing", "decreasing",
+    "before", "after", "vs", "versus", "top", "bottom", "highest", "lowest", "max", "min", "maximum",
+    "minimum", "most", "least", "best", "worst", "first", "last",
+}
+VECTOR_DIM = 1 << 18
+# How many recent entries of a scope are compared when there is no exact match
+SCAN_LIMIT = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    scope TEXT NOT NULL,
+    query_key TEXT NOT NULL,
+    query TEXT NOT NULL,
+    vector TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_hit REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (scope, query_key)
+);
+CREATE INDEX IF NOT EXISTS answers_scope_last_hit ON answers (scope, last_hit);
+"""
+
+
+def query_tokens(text: str) -> list:
+    """Lower-case, drop punctuation and stopwords, and return the content words in question order."""
+    words = re.findall(r"\w+", text.lower())
+    return [w for w in words if w not in STOPWORDS or w in POLARITY_WORDS]
+
+
+def is_follow_up(text: str) -> bool:
+    """Return True if a question refers back to the conversation and so cannot be answered from the cache."""
+    return bool(set(re.findall(r"\w+", text.lower())) & FOLLOW_UP_WORDS)
+
+
+def _signature(tokens: list) -> list:
+    """The tokens a near match must reproduce exactly: numbers and polarity/direction words, in order."""
+    return [t for t in tokens if t.isdigit() or t in POLARITY_WORDS]
+
+
+def _vectorize(tokens: list) -> dict:
+    """
+    Hash words and character trigrams into an L2-normalized sparse vector.
+
+    Word order is ignored, so "profit by country in total" matches "total profit by
+    country"; ``_signature`` keeps reorderings of numbers and polarity words apart.
+    """
+    vector = {}
+    for token in tokens:
+        features = [(f"w:{token}", 1.0)]
+        padded = f"#{token}#"
+        features += [(f"c:{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2)]
+        for feature, weight in features:
+            index = int.from_bytes(hashlib.md5(feature.encode("utf-8")).digest()[:4], "little") % VECTOR_DIM
+            vector[index] = vector.get(index, 0.0) + weight
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {index: value / norm for index, value in vector.items()}
+
+
+def _cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+
+class AnswerCache:
+    """
+    SQLite-backed cache of final answers, scoped by dataset content and model.
+
+    Lookups first try the normalized query text, then compare a hashed
+    vector of words and character trigrams against recent entries of the same
+    scope to catch rephrasings such as "total profit by country" / "total
+    profit for each country". Numbers and polarity words must agree exactly,
+    and questions that refer back to the conversation are never cached.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        ttl_seconds: float = None,
+        max_entries: int = None,
+        similarity: float = None,
+    ):
+        self.path = path or os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 5000))
+        self.similarity = similarity if similarity is not None else float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.9))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def make_scope(dataset_version: str, model: str) -> str:
+        """Combine the dataset content hash and model into a cache scope."""
+        return hashlib.sha256(f"{dataset_version}|{model}".encode("utf-8")).hexdigest()
+
+    def lookup(self, query: str, dataset_version: str, model: str):
+        """
+        Return a cached answer for ``query``, or None.
+
+        :param query: The user's question.
+        :param dataset_version: The content hash of the datasets the answer was computed on.
+        :param model: The model that produced the answer.
+        """
+        tokens = query_tokens(query)
+        if len(tokens) < MIN_CONTENT_TOKENS or is_follow_up(query):
+            return None
+        scope = self.make_scope(dataset_version, model)
+        now = time.time()
+        oldest = now - self.ttl_seconds
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, answer FROM answers WHERE scope = ? AND query_key = ? AND created_at >= ?",
+                (scope, " ".join(tokens), oldest),
+            ).fetchone()
+            if row is None:
+                row = self._nearest(scope, tokens, oldest)
+            if row is None:
+                return None
+            self._conn.execute("UPDATE answers SET last_hit = ?, hits = hits + 1 WHERE id = ?", (now, row[0]))
+            self._conn.commit()
+        logging.info(f"Answer cache hit for: {query}")
+        return row[1]
+
+    def _nearest(self, scope: str, tokens: list, oldest: float):
+        signature = _signature(tokens)
+        vector = _vectorize(tokens)
+        best, best_score = None, self.similarity
+        rows = self._conn.execute(
+            "SELECT id, answer, query_key, vector FROM answers "
+            "WHERE scope = ? AND created_at >= ? ORDER BY last_hit DESC LIMIT ?",
+            (scope, oldest, SCAN_LIMIT),
+        )
+        for row_id, answer, query_key, stored in rows:
+            # Years, quantities, top-N sizes and words such as excluding/descending must match exactly
+            if _signature(query_key.split()) != signature:
+                continue
+            score = _cosine(vector, {int(k): v for k, v in json.loads(stored).items()})
+            if score >= best_score:
+                best, best_score = (row_id, answer), score
+        return best
+
+    def store(self, query: str, dataset_version: str, model: str, answer: str) -> None:
+        """Cache ``answer`` for ``query`` and evict expired or excess entries."""
+        tokens = query_tokens(query)
+        if len(tokens) < MIN_CONTENT_TOKENS or not answer or is_follow_up(query):
+            return
+        scope = self.make_scope(dataset_version, model)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (scope, query_key, query, vector, answer, created_at, last_hit) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, " ".join(tokens), query, json.dumps(_vectorize(tokens)), answer, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_hit LIMIT ?)",
+                (excess,),
+            )
+
+    def clear(self) -> None:
+        """Remove every cached answer."""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide AnswerCache, or None when ``ANSWER_CACHE`` is set to 0."""
+    global _cache
+    if os.getenv("ANSWER_CACHE", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
+
+
+if __name__ == "__main__":
+    # Check fuzzy matching on known question pairs: python H_answercache.py
+    import sys
+    import tempfile
+
+    CHECKS = [
+        ("total profit by country", "profit by country in total", True),
+        ("total profit by country", "total profit for each country", True),
+        ("products with discount", "products without discount", False),
+        ("countries with profit above 1000", "countries with profit below 1000", False),
+        ("total profit by country", "total profit by country in 2014", False),
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        cache = AnswerCache(path=os.path.join(folder, "answers.sqlite3"))
+        failed = 0
+        for stored, asked, expected in CHECKS:
+            cache.store(stored, "check", "check", stored)
+            hit = cache.lookup(asked, "check", "check") == stored
+            failed += hit != expected
+            print(f"{'ok  ' if hit == expected else 'FAIL'} {'hit ' if hit else 'miss'} {stored!r} / {asked!r}")
+        cache._conn.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,159 @@
+import os
+import csv
+import json
+import time
+import asyncio
+import logging
+from collections import Counter
+from H_tracing import new_trace_id
+
+
+def load_questions(path: str) -> list:
+    """
+    Read batch questions from a JSONL or CSV file.
+
+    JSONL lines are either strings or objects with a ``question`` field; CSV files
+    need a ``question`` column (or use their first column). An ``id`` field or
+    column names each question; otherwise its position in the file is used.
+    Ids key the checkpoint, so they must be unique.
+
+    :return: ``[{"id", "question"}]`` in file order.
+    :raises ValueError: If two questions have the same id.
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            column = "question" if "question" in (reader.fieldnames or []) else reader.fieldnames[0]
+            rows = [(row.get("id"), row[column]) for row in reader]
+        else:
+            rows = []
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                rows.append((item.get("id"), item["question"]) if isinstance(item, dict) else (None, item))
+    for index, (question_id, question) in enumerate(rows, start=1):
+        if question and str(question).strip():
+            questions.append({"id": str(question_id or index), "question": str(question).strip()})
+    counts = Counter(q["id"] for q in questions)
+    duplicates = sorted(question_id for question_id, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate question ids in {path}: {', '.join(duplicates)}")
+    return questions
+
+
+def completed_ids(output_path: str) -> set:
+    """Return the ids already answered successfully in an earlier run's output (the checkpoint)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; that question runs again
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+class RateLimiter:
+    """Spaces out question starts to at most ``rate`` per second (no limit when ``rate`` is 0)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> float:
+        """Wait for the next slot and return how long that took."""
+        if not self.interval:
+            return 0.0
+        async with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self.interval
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class BatchRunner:
+    """
+    Answers a list of questions concurrently against one warm agent stack.
+
+    Every question gets its own conversation memory, so answers do not depend
+    on the order they finish in. Results are appended to a JSONL file as soon
+    as each one finishes; that file doubles as the checkpoint, so a rerun skips
+    the questions it already answered and retries the failed ones.
+    """
+
+    def __init__(self, agent, concurrency: int = None, rate: float = None):
+        """
+        :param agent: A TyphoonAgent whose LLM clients, tools and datasets are shared by all questions.
+        :param concurrency: Questions in flight at once (``BATCH_CONCURRENCY``, default 4).
+        :param rate: Question starts per second (``BATCH_RATE``, default 0 = unlimited).
+        """
+        self.agent = agent
+        self.concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", 4))
+        self.rate = rate if rate is not None else float(os.getenv("BATCH_RATE", 0))
+
+    async def run(self, questions: list, output_path: str) -> dict:
+        """
+        Answer ``questions`` and append one JSON record per question to ``output_path``.
+
+        :param questions: ``[{"id", "question"}]``, as returned by ``load_questions``.
+        :param output_path: The results file; questions already answered in it are skipped.
+        :return: Counts of answered, failed and skipped questions, and the wall time.
+        """
+        done = completed_ids(output_path)
+        pending = [q for q in questions if q["id"] not in done]
+        logging.info(f"Batch: {len(pending)} questions to run, {len(questions) - len(pending)} already answered.")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = RateLimiter(self.rate)
+        write_lock = asyncio.Lock()
+        summary = {"ok": 0, "failed": 0, "skipped": len(questions) - len(pending)}
+        started = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out:
+
+            async def answer(item: dict) -> None:
+                async with semaphore:
+                    waited = await limiter.wait()
+                    record = await self.answer(item)
+                    record["rate_wait"] = round(waited, 4)
+                async with write_lock:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                summary[record["status"]] += 1
+                logging.info(f"Batch: {record['id']} {record['status']} in {record['seconds']:.2f}s.")
+
+            await asyncio.gather(*(answer(item) for item in pending))
+
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+
+    async def answer(self, item: dict) -> dict:
+        """Answer one question through a memory-isolated view of the agent."""
+        session = self.agent.bind_memory(self.agent.initialize_memory())
+        trace_id = new_trace_id()
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            result = await session.arespond(item["question"], trace_id)
+        except Exception as e:
+            result = {"ok": False, "answer": None, "error": str(e)}
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "status": "ok" if result["ok"] else "failed",
+            "answer": result["answer"],
+            "error": result["error"],
+            "trace_id": trace_id,
+            "started_at": started_at,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
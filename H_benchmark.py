@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import urllib.request
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then not reported
+    resource = None
+
+DEFAULT_QUESTIONS = [
+    "What is the total profit by country?",
+    "What is the average sale price?",
+    "How many units sold in 2014?",
+    "Top 5 products by sales",
+    "Which segment has the highest profit margin and why?",
+    "Describe the discounts given in each discount band.",
+    "Compare gross sales between Canada and Germany over time.",
+]
+# Rows written per chunk when generating a scaled dataset
+SCALE_CHUNK_ROWS = 1_000_000
+
+
+def scaled_dataset(source: str, rows: int, directory: str) -> str:
+    """
+    Write ``rows`` rows resampled from ``source`` to a CSV in ``directory`` and return its path.
+
+    The raw text of the source is resampled, so formatting quirks (currency, padding,
+    accounting dashes) survive and the preprocessing cost scales realistically.
+    Existing files are reused.
+    """
+    name = os.path.splitext(os.path.basename(source))[0]
+    path = os.path.join(directory, f"{name}_{rows}.csv")
+    if os.path.exists(path):
+        return path
+    base = pd.read_csv(source, dtype=str, keep_default_na=False)
+    partial = f"{path}.tmp"
+    written = 0
+    while written < rows:
+        chunk = base.sample(n=min(SCALE_CHUNK_ROWS, rows - written), replace=True, random_state=written)
+        chunk.to_csv(partial, mode="a", header=written == 0, index=False)
+        written += len(chunk)
+    os.replace(partial, path)
+    return path
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _stub_stats(base_url: str) -> dict:
+    try:
+        with urllib.request.urlopen(f"{base_url.rstrip('/')}/stats", timeout=5) as response:
+            return json.load(response)
+    except OSError:
+        return None
+
+
+class StageTimer(BaseCallbackHandler):
+    """Collect LLM and tool timings and agent iteration counts for one question."""
+
+    def __init__(self):
+        self._started = {}
+        self._tools = {}
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.tool_seconds = {}
+        self.iterations = {}
+
+    def _start(self, run_id) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def _elapsed(self, run_id) -> float:
+        started = self._started.pop(run_id, None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.llm_calls += 1
+        self.llm_seconds += self._elapsed(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._elapsed(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._tools[run_id] = (serialized or {}).get("name") or kwargs.get("name") or "tool", time.perf_counter()
+
+    def _tool_done(self, run_id) -> None:
+        entry = self._tools.pop(run_id, None)
+        if entry is not None:
+            name, started = entry
+            self.tool_seconds[name] = self.tool_seconds.get(name, 0.0) + time.perf_counter() - started
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._tool_done(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._tool_done(run_id)
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        # The supervisor calls pandas_agent/summary_agent; the pandas agent calls python_repl_ast
+        agent = "pandas" if action.tool == "python_repl_ast" else "supervisor"
+        self.iterations[agent] = self.iterations.get(agent, 0) + 1
+
+
+def run_scale(dataset_path: str, questions: list, base_url: str, model_name: str, cache_dir: str) -> dict:
+    """
+    Benchmark the full pipeline on one dataset; meant to run in a fresh process.
+
+    :return: Startup stage timings, one record per question and the process's peak RSS.
+    """
+    os.environ["DATASET_CACHE_DIR"] = cache_dir
+    from H_datahandle import DataHandler
+    from H_supervisor import TyphoonAgent
+
+    key = os.path.basename(dataset_path)
+    stages = {}
+    started = time.perf_counter()
+    handler = DataHandler(dataset_paths={key: dataset_path})
+    handler.load_data()
+    stages["load_cold"] = time.perf_counter() - started
+    started = time.perf_counter()
+    handler.preprocess_data()
+    stages["preprocess_cold"] = time.perf_counter() - started
+    rows = len(handler.get_data(key))
+    handler.close()
+
+    started = time.perf_counter()
+    agent = TyphoonAgent(temperature=0.0, base_url=base_url, model_name=model_name, dataset_paths={key: dataset_path})
+    stages["startup_warm"] = time.perf_counter() - started
+
+    records = []
+    for question in questions:
+        # Fresh memory per question keeps the prompts comparable across the corpus
+        session = agent.bind_memory(agent.initialize_memory())
+        timer = StageTimer()
+        before = _stub_stats(base_url)
+        started = time.perf_counter()
+        try:
+            output = session.agent_executor.invoke({"input": question}, {"callbacks": [timer]})["output"]
+            error = None
+        except Exception as e:
+            output, error = "", f"{type(e).__name__}: {e}"
+        total = time.perf_counter() - started
+        after = _stub_stats(base_url)
+        records.append({
+            "question": question,
+            "seconds": round(total, 4),
+            "llm_calls": timer.llm_calls,
+            "llm_seconds": round(timer.llm_seconds, 4),
+            "tool_seconds": {name: round(value, 4) for name, value in timer.tool_seconds.items()},
+            "iterations": timer.iterations,
+            "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"] if before and after else None,
+            "answer_chars": len(output),
+            "error": error,
+        })
+    agent.pandas_agent.handler.close()
+
+    stages = {name: round(value, 4) for name, value in stages.items()}
+    return {"dataset": key, "rows": rows, "stages": stages, "questions": records, "peak_rss_mb": _peak_rss_mb()}
+
+
+def summarize(result: dict) -> dict:
+    """Aggregate the per-question records of ``run_scale``."""
+    records = result["questions"]
+    seconds = [r["seconds"] for r in records]
+    tokens = [r["prompt_tokens"] for r in records if r["prompt_tokens"] is not None]
+    return {
+        "rows": result["rows"],
+        **result["stages"],
+        "p50_s": round(_percentile(seconds, 0.5), 4),
+        "p95_s": round(_percentile(seconds, 0.95), 4),
+        "mean_llm_calls": round(statistics.mean(r["llm_calls"] for r in records), 2) if records else 0,
+        "mean_iterations": round(statistics.mean(sum(r["iterations"].values()) for r in records), 2) if records else 0,
+        "prompt_tokens": sum(tokens) if tokens else None,
+        "errors": sum(1 for r in records if r["error"]),
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark of the agent pipeline.")
+    parser.add_argument("--dataset", default="./Financials.csv")
+    parser.add_argument("--rows", type=int, nargs="*", default=[0, 100_000],
+                        help="scaled dataset sizes; 0 runs the dataset as is")
+    parser.add_argument("--questions", help="text file with one question per line")
+    parser.add_argument("--base-url", help="use this endpoint instead of starting the local stub")
+    parser.add_argument("--model", default="typhoon-v1.5x-70b-instruct")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub seconds before each reply")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="stub seconds between streamed chunks")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "typhoon_benchmark"))
+    parser.add_argument("--output", help="write the full results as JSON to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        from H_stubllm import StubLLM, StubServer
+
+        server = StubServer(StubLLM(latency=args.latency, token_latency=args.token_latency)).start()
+        base_url = server.base_url
+        for name in ("TYPHOON_API_KEY", "PANDAS_API_KEY", "PLOT_API_KEY"):
+            os.environ.setdefault(name, "stub")
+    # Every question must reach the pipeline, not an earlier run's cached answer
+    os.environ["ANSWER_CACHE"] = "0"
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    try:
+        for rows in args.rows:
+            path = args.dataset if rows == 0 else scaled_dataset(args.dataset, rows, args.workdir)
+            cache_dir = tempfile.mkdtemp(prefix="cache_", dir=args.workdir)
+            # A fresh process per size keeps peak RSS and the dataset registry separate
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(run_scale, path, questions, base_url, args.model, cache_dir).result()
+            results.append(result)
+            print(json.dumps({"dataset": result["dataset"], **summarize(result)}))
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# Characters of the first user message used as a session title
+TITLE_CHARS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_user_updated ON sessions (username, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+"""
+
+
+class ChatStore:
+    """
+    Append-only, SQLite-backed chat history.
+
+    Saving a message inserts one row, whatever the size of the user's history.
+    Session lists carry only titles, and messages are read a page at a time
+    with keyset pagination on the message id.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: The SQLite file (``CHAT_STORE_PATH``, default ``chat_history.sqlite3``).
+        """
+        self.path = path or os.getenv("CHAT_STORE_PATH", "chat_history.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def create_session(self, username: str, title: str = "") -> int:
+        """Start a session for ``username`` and return its id."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO sessions (username, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (username, title, now, now),
+            )
+        return cursor.lastrowid
+
+    def append_message(self, session_id: int, role: str, content: str, timestamp: str) -> int:
+        """
+        Append one message to a session and return its id.
+
+        The session's title is set from its first user message.
+        """
+        content = "" if content is None else str(content)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, timestamp),
+            )
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+            if role == "user":
+                self._conn.execute(
+                    "UPDATE sessions SET title = ? WHERE id = ? AND title = ''",
+                    (content.strip()[:TITLE_CHARS], session_id),
+                )
+        return cursor.lastrowid
+
+    def list_sessions(self, username: str, limit: int = 50, offset: int = 0) -> list:
+        """Return ``username``'s sessions, most recently active first, without their messages."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, created_at, updated_at FROM sessions WHERE username = ? "
+                "ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (username, limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_session(self, session_id: int):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, username, title, created_at, updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def count_messages(self, session_id: int) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def messages(self, session_id: int, limit: int = None, before_id: int = None, offset: int = 0) -> list:
+        """
+        Return a page of a session's messages in chronological order.
+
+        :param session_id: The session.
+        :param limit: How many of the latest messages to return (all if None).
+        :param before_id: Only return messages older than this message id.
+        :param offset: Skip this many of the latest messages first (page-number navigation).
+        :return: ``[{"id", "role", "content", "timestamp"}]``.
+        """
+        query = "SELECT id, role, content, timestamp FROM messages WHERE session_id = ?"
+        params = [session_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC"
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def migrate(self, username: str, data_path: str) -> int:
+        """
+        Import the sessions of a legacy ``data.json`` file, which is then renamed to ``.migrated``.
+
+        :return: The number of sessions imported.
+        """
+        if not os.path.exists(data_path):
+            return 0
+        with open(data_path, "r", encoding="utf-8") as f:
+            sessions = json.load(f).get("chat_sessions", [])
+        now = time.time()
+        with self._lock, self._conn:
+            for session in sessions:
+                history = session.get("history", [])
+                title = session.get("title") or next(
+                    (m["content"] for m in history if m.get("role") == "user"), ""
+                )
+                cursor = self._conn.execute(
+                    "INSERT INTO sessions (username, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (username, str(title).strip()[:TITLE_CHARS], now, now),
+                )
+                self._conn.executemany(
+                    "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                    [
+                        (cursor.lastrowid, m.get("role", ""), str(m.get("content") or ""), m.get("timestamp", ""))
+                        for m in history
+                    ],
+                )
+                # Later sessions in the file count as more recently active
+                now += 1e-3
+        os.replace(data_path, f"{data_path}.migrated")
+        logging.info(f"Imported {len(sessions)} chat sessions for {username} from {data_path}.")
+        return len(sessions)
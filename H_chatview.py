@@ -0,0 +1,131 @@
+import os
+import html
+import math
+import functools
+import streamlit as st
+
+# Messages shown at first, and added by each "load older" click
+CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", 20))
+CHAT_LOG_PAGE_SIZE = int(os.getenv("CHAT_LOG_PAGE_SIZE", 20))
+# Sessions listed at first, and added by each "load older chats" click
+SESSION_WINDOW = int(os.getenv("SESSION_WINDOW", 50))
+
+MESSAGE_CSS = """
+<style>
+.chat-row {
+    display: flex;
+    margin-bottom: 10px;
+}
+.chat-row.user {
+    justify-content: flex-end;
+}
+.chat-row.assistant {
+    justify-content: flex-start;
+}
+.chat-row .message {
+    padding: 10px;
+    border-radius: 8px;
+    max-width: 80%;
+    word-wrap: break-word;
+    white-space: pre-wrap;
+    background-color: var(--background-color);
+    color: invert(var(--background-color));
+    transition: background-color 0.3s ease, color 0.3s ease;
+}
+</style>
+"""
+
+
+def inject_css() -> None:
+    """Emit the chat styles; call once per script run, before any message is rendered."""
+    st.markdown(MESSAGE_CSS, unsafe_allow_html=True)
+
+
+@functools.lru_cache(maxsize=4096)
+def message_html(message_id: int, role: str, content: str) -> str:
+    """Render one stored message as an HTML fragment; messages never change, so fragments are cached."""
+    side = "user" if role == "user" else "assistant"
+    return f'<div class="chat-row {side}"><div class="message">{html.escape(content)}</div></div>'
+
+
+def render_messages(messages: list) -> None:
+    """
+    Render stored messages in order.
+
+    User turns are escaped HTML bubbles, batched into one element. Assistant
+    answers go through ``st.markdown`` with raw HTML disabled, so the tables,
+    lists and code the agents write are rendered but cannot inject markup.
+    """
+    fragments = []
+    for message in messages:
+        if message["role"] == "user":
+            fragments.append(message_html(message["id"], message["role"], message["content"]))
+            continue
+        if fragments:
+            st.markdown("".join(fragments), unsafe_allow_html=True)
+            fragments = []
+        st.markdown(message["content"])
+    if fragments:
+        st.markdown("".join(fragments), unsafe_allow_html=True)
+
+
+def _show_older(window_key: str, window: int) -> None:
+    st.session_state[window_key] = window + CHAT_WINDOW
+
+
+def _show_older_sessions(window: int) -> None:
+    st.session_state.session_window = window + SESSION_WINDOW
+
+
+def visible_sessions(store, username: str) -> list:
+    """Return the sessions listed in the sidebar and chat log: the latest ones plus any older pages loaded."""
+    window = st.session_state.get("session_window", SESSION_WINDOW)
+    return store.list_sessions(username, limit=window)
+
+
+def render_older_sessions_button(store, username: str) -> None:
+    """Show a control that lists the next page of older sessions, if there are any."""
+    window = st.session_state.get("session_window", SESSION_WINDOW)
+    if store.list_sessions(username, limit=1, offset=window):
+        st.button("Load older chats", key="load_older_sessions", on_click=_show_older_sessions, args=(window,))
+
+
+def render_chat(store, session_id: int) -> None:
+    """
+    Render the latest messages of a session, with a control that pages in older ones.
+
+    :param store: The ChatStore holding the session.
+    :param session_id: The session to show.
+    """
+    session = store.get_session(session_id)
+    st.subheader(f"Session: {session['title'] or 'New Chat'}")
+
+    window_key = f"chat_window_{session_id}"
+    window = st.session_state.get(window_key, CHAT_WINDOW)
+    total = store.count_messages(session_id)
+    if total > window:
+        st.button(f"Load older messages ({total - window} more)", key=f"load_older_{session_id}",
+                  on_click=_show_older, args=(window_key, window))
+
+    render_messages(store.messages(session_id, limit=window))
+
+
+def render_chat_log(store, username: str) -> None:
+    """Render one session's log at a time, a page of messages per view, newest page first."""
+    sessions = visible_sessions(store, username)
+    if not sessions:
+        st.write("No chat logs available.")
+        return
+
+    titles = {session["id"]: session["title"] or f"Session {session['id']}" for session in sessions}
+    session_id = st.selectbox("Session", list(titles), format_func=titles.get, key="chat_log_session")
+    total = store.count_messages(session_id)
+    pages = max(1, math.ceil(total / CHAT_LOG_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.number_input("Page (1 = newest)", min_value=1, max_value=pages, value=1,
+                               key=f"chat_log_page_{session_id}")
+    offset = (page - 1) * CHAT_LOG_PAGE_SIZE
+    for chat in store.messages(session_id, limit=CHAT_LOG_PAGE_SIZE, offset=offset):
+        st.write(f"{chat['timestamp']} | {chat['role'].capitalize()}: {chat['content']}")
+    st.caption(f"Page {page} of {pages} · {total} messages")
@@ -1,35 +1,108 @@
 import os
+import io
+import json
+import uuid
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
 import pandas as pd
 import logging
+from H_schema import infer_schema, apply_schema
+from H_profile import profile_frame
+from H_datasetindex import DatasetIndex
+from H_registry import DatasetRegistry, get_registry
+from H_tracing import span
+from H_resultcache import get_result_cache
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; without it every load re-parses the source file
+    feather = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Where cleaned, standardized frames are cached as uncompressed Feather (Arrow IPC) files
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", ".dataset_cache")
+# Bump whenever the cleaning/standardization applied before caching changes
+CACHE_FORMAT_VERSION = "3"
+# Schemas and profiles kept in memory; older ones are read back from their sidecar files
+MAX_MEMO_ENTRIES = int(os.getenv("DATASET_MEMO_ENTRIES", 64))
+_memo_lock = threading.Lock()
 
-class DataHandler:
-    _instance = None
 
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(DataHandler, cls).__new__(cls)
-        return cls._instance
+def _remember(memo: OrderedDict, key, value) -> None:
+    """Store ``value`` in a class-level memo, dropping its oldest entries past ``MAX_MEMO_ENTRIES``."""
+    with _memo_lock:
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > MAX_MEMO_ENTRIES:
+            memo.popitem(last=False)
+
+
+# Digests of files already hashed in this process, keyed by (path, size, mtime)
+_digest_memo = {}
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    _digest_memo[memo_key] = digest.hexdigest()
+    return _digest_memo[memo_key]
+
 
-    def __init__(self, dataset_paths=None):
+def datasets_fingerprint(dataset_paths: dict) -> str:
+    """
+    Fingerprint a set of datasets by key and file contents.
+
+    :param dataset_paths: A dictionary of dataset keys to file paths.
+    :return: A hex digest that changes whenever a key or a file's bytes change.
+    """
+    digest = hashlib.sha256()
+    for key in sorted(dataset_paths):
+        digest.update(key.encode("utf-8"))
+        digest.update(file_digest(dataset_paths[key]).encode("ascii"))
+    return digest.hexdigest()
+
+
+class DataHandler:
+    # Column schemas inferred by preprocess_data, keyed by file digest
+    _schemas = OrderedDict()
+    # Dataset profiles keyed by file digest, and the latest digest profiled for each path
+    _profiles = OrderedDict()
+    _profiled_paths = OrderedDict()
+
+    def __init__(self, dataset_paths=None, session_id: str = None, registry: DatasetRegistry = None):
         """
         Initialize the DataHandler with dataset paths.
         
         :param dataset_paths: A dictionary where keys are identifiers (e.g., "df1", "df2")
                               and values are file paths to the datasets.
+        :param session_id: The session these datasets belong to; a new one is generated if omitted.
+        :param registry: The registry holding the frames (defaults to the process-wide one).
         """
-        if not hasattr(self, '_initialized'):  
-            self._initialized = True
-            if dataset_paths is None:
-                dataset_paths = {}
-            self.dataset_paths = dataset_paths
-            self._data = {}
+        if dataset_paths is None:
+            dataset_paths = {}
+        self.dataset_paths = dataset_paths
+        self.session_id = session_id or uuid.uuid4().hex
+        self.registry = registry or get_registry()
+        self.index = DatasetIndex()
 
     def load_data(self) -> None:
-        """Load and standardize data from all provided file paths."""
+        """
+        Load, standardize and convert data from all provided file paths.
+
+        Frames are converted to their schema before they are registered, so a
+        frame shared through the registry is never modified afterwards.
+        """
         if not self.dataset_paths:
             raise ValueError("No dataset paths provided.")
 
@@ -38,44 +111,196 @@ class DataHandler:
                 raise FileNotFoundError(f"Dataset file not found at {dataset_path}.")
 
             _, ext = os.path.splitext(dataset_path)
-            if ext == ".csv":
-                try:
-                    self._data[key] = pd.read_csv(dataset_path, encoding="utf-8")
-                except UnicodeDecodeError:
-                    logging.warning(f"UTF-8 decoding failed for {key}. Trying 'latin1'.")
-                    self._data[key] = pd.read_csv(dataset_path, encoding="latin1")
-            elif ext in [".xls", ".xlsx"]:
-                self._data[key] = pd.read_excel(dataset_path)
-            else:
+            if ext not in [".csv", ".xls", ".xlsx"]:
                 raise ValueError(f"Unsupported file extension for {key}: {ext}")
 
+            with span("dataset_load", key) as attrs:
+                digest = file_digest(dataset_path)
+                self._invalidate_results(key, digest)
+                loader = functools.partial(self._load_frame, key, dataset_path, digest, True)
+                if self.registry.is_resident(digest):
+                    df = self.registry.register(self.session_id, key, digest, loader)
+                    attrs["source"] = "memory"
+                    logging.info(f"Data for {key} shared from memory ({digest[:12]}).")
+                else:
+                    attrs["source"] = "cache" if os.path.exists(self.cache_path(digest)) else "file"
+                    df = loader()
+                    self.registry.register(self.session_id, key, digest, loader, df=df)
+                attrs["rows"] = len(df)
+            logging.info(f"Data for {key} loaded. Columns: {', '.join(df.columns)}")
+
+    def _invalidate_results(self, key: str, digest: str) -> None:
+        """Drop cached execution results of the dataset ``key`` is replacing, if its content changed."""
+        result_cache = get_result_cache()
+        if result_cache is None or key not in self.keys():
+            return
+        previous = self.get_digest(key)
+        if previous != digest:
+            result_cache.invalidate(previous)
+
+    def _load_frame(self, key: str, dataset_path: str, digest: str, prepare: bool = False) -> pd.DataFrame:
+        """Read a dataset from the columnar cache, or parse and cache it."""
+        df = self._read_cache(digest)
+        if df is not None:
+            logging.info(f"Data for {key} loaded from cache {digest[:12]}.")
+        else:
+            _, ext = os.path.splitext(dataset_path)
+            with open(dataset_path, "rb") as f:
+                raw = f.read()
+            df = self._parse(key, raw, ext)
             # Standardize column names
-            self._data[key].columns = (
-                self._data[key].columns.str.lower().str.strip().str.replace(" ", "_")
-            )
-            logging.info(f"Data for {key} loaded. Columns: {', '.join(self._data[key].columns)}")
+            df.columns = df.columns.str.lower().str.strip().str.replace(" ", "_")
+            self._write_cache(digest, df)
+        if prepare:
+            self._prepare(digest, df)
+        return df
+
+    @staticmethod
+    def _parse(key: str, raw: bytes, ext: str) -> pd.DataFrame:
+        """Parse the raw bytes of a CSV or Excel file."""
+        if ext == ".csv":
+            encoding = "utf-8"
+            try:
+                raw.decode("utf-8")
+            except UnicodeDecodeError:
+                logging.warning(f"UTF-8 decoding failed for {key}. Trying 'latin1'.")
+                encoding = "latin1"
+            return pd.read_csv(io.BytesIO(raw), encoding=encoding)
+        return pd.read_excel(io.BytesIO(raw))
+
+    @staticmethod
+    def cache_path(digest: str) -> str:
+        """Return the columnar cache file for a content digest."""
+        return os.path.join(DATASET_CACHE_DIR, f"{digest}-v{CACHE_FORMAT_VERSION}.feather")
+
+    def _read_cache(self, digest: str):
+        """Memory-map a cached frame, or return None when there is no usable cache."""
+        if feather is None:
+            return None
+        path = self.cache_path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = feather.read_table(path, memory_map=True)
+            return table.to_pandas(split_blocks=True)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable dataset cache {path}: {e}")
+            return None
+
+    def _write_cache(self, digest: str, df: pd.DataFrame) -> None:
+        """Write a frame to the columnar cache atomically; failures only cost the cache."""
+        if feather is None:
+            return
+        path = self.cache_path(digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+            feather.write_feather(df, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not cache dataset {digest[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def preprocess_data(self) -> None:
-        """Preprocess numeric-like columns for all datasets."""
-        if not self._data:
+        """Profile the loaded datasets and add them to the routing index; ``load_data`` already converted them."""
+        if not self.keys():
             raise ValueError("Data not loaded.")
 
-        for key, df in self._data.items():
-            numeric_like_cols = [
-                col
-                for col in df.columns
-                if df[col].dtype == "object" and df[col].str.contains(r"[\d,.$€¥-]").any()
-            ]
-
-            for col in numeric_like_cols:
-                try:
-                    df[col] = df[col].str.replace(r"[^\d.-]", "", regex=True)
-                    df[col] = pd.to_numeric(df[col], errors="coerce")
-                except Exception as e:
-                    logging.error(f"Error processing column {col} in dataset {key}: {e}")
+        for key in self.keys():
+            with span("preprocess", key):
+                self.index.add(key, self.get_profile(key))
 
         logging.info("Preprocessing complete.")
 
+    def _prepare(self, digest: str, df: pd.DataFrame) -> bool:
+        """Convert a frame in place using its (possibly cached) schema; return True if it changed."""
+        schema = self._schemas.get(digest) or self._read_sidecar(digest, "schema")
+        if schema is None:
+            schema = infer_schema(df)
+            self._write_sidecar(digest, "schema", schema)
+        _remember(self._schemas, digest, schema)
+
+        if apply_schema(df, schema):
+            # Cache the converted frame so the next load skips conversion entirely
+            self._write_cache(digest, df)
+            return True
+        return False
+
+    def get_profile(self, key: str) -> dict:
+        """
+        Retrieve the profile of a dataset, computing it on first use.
+
+        :param key: The key identifying the dataset (e.g., "df1", "df2").
+        :return: A profile as built by ``H_profile.profile_frame``.
+        """
+        digest = self.get_digest(key)
+        profile = self._profiles.get(digest) or self._read_sidecar(digest, "profile")
+        if profile is None:
+            return self.refresh_profile(key)
+        _remember(self._profiles, digest, profile)
+        return profile
+
+    def refresh_profile(self, key: str) -> dict:
+        """
+        Re-profile a dataset after its data changed; only changed columns are recomputed.
+
+        :param key: The key identifying the dataset (e.g., "df1", "df2").
+        :return: The updated profile.
+        """
+        digest = self.get_digest(key)
+        path = os.path.abspath(self.dataset_paths.get(key, key))
+        previous = self._profiles.get(digest) or self._profiles.get(self._profiled_paths.get(path))
+        profile = profile_frame(self.get_data(key), previous)
+        _remember(self._profiles, digest, profile)
+        _remember(self._profiled_paths, path, digest)
+        self._write_sidecar(digest, "profile", profile)
+        if key in self.index:
+            self.index.add(key, profile)
+        return profile
+
+    @staticmethod
+    def sidecar_path(digest: str, name: str) -> str:
+        """Return the JSON sidecar file (e.g. ``schema``) stored next to a cached dataset."""
+        return os.path.join(DATASET_CACHE_DIR, f"{digest}-v{CACHE_FORMAT_VERSION}.{name}.json")
+
+    def _read_sidecar(self, digest: str, name: str):
+        if digest is None:
+            return None
+        path = self.sidecar_path(digest, name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable {name} {path}: {e}")
+            return None
+
+    def _write_sidecar(self, digest: str, name: str, data: dict) -> None:
+        if digest is None:
+            return
+        try:
+            os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+            with open(self.sidecar_path(digest, name), "w", encoding="utf-8") as f:
+                json.dump(data, f, default=str)
+        except OSError as e:
+            logging.warning(f"Could not save {name} for {digest[:12]}: {e}")
+
+    def keys(self) -> list:
+        """Return the keys of the loaded datasets."""
+        return self.registry.keys(self.session_id)
+
+    def route(self, query: str) -> list:
+        """
+        Pick the dataset(s) a question is about using the routing index.
+
+        :param query: The user's question.
+        :return: Dataset keys, best match first.
+        """
+        keys = self.index.route(query)
+        return keys or self.keys()[:1]
+
     def get_data(self, key: str) -> pd.DataFrame:
         """
         Retrieve the loaded data for a specific key.
@@ -83,6 +308,25 @@ class DataHandler:
         :param key: The key identifying the dataset (e.g., "df1", "df2").
         :return: The loaded DataFrame.
         """
-        if key not in self._data:
-            raise ValueError(f"Data for key '{key}' not loaded.")
-        return self._data[key]
\ No newline at end of file
+        return self.registry.get(self.session_id, key)
+
+    def get_digest(self, key: str) -> str:
+        """
+        Retrieve the content digest of the file a dataset was loaded from.
+
+        :param key: The key identifying the dataset (e.g., "df1", "df2").
+        :return: The SHA-256 hex digest of the source file.
+        """
+        return self.registry.digest(self.session_id, key)
+
+    def version(self) -> str:
+        """Return a digest identifying the keys and exact contents of all loaded datasets."""
+        digest = hashlib.sha256()
+        for key in sorted(self.keys()):
+            digest.update(key.encode("utf-8"))
+            digest.update(self.get_digest(key).encode("ascii"))
+        return digest.hexdigest()
+
+    def close(self) -> None:
+        """Release this handler's datasets so the registry can reclaim their memory."""
+        self.registry.release_session(self.session_id)
\ No newline at end of file
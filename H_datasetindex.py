@@ -0,0 +1,140 @@
+import re
+import math
+
+# Question words mapped to the column words they usually refer to
+SYNONYMS = {
+    "revenue": ["sales", "gross"], "turnover": ["sales"], "income": ["profit"], "earnings": ["profit"],
+    "margin": ["profit"], "cost": ["cogs", "manufacturing"], "costs": ["cogs", "manufacturing"],
+    "quantity": ["units"], "qty": ["units"], "volume": ["units"], "sold": ["units", "sales"],
+    "discount": ["discounts"], "nation": ["country"], "nations": ["country"], "countries": ["country"],
+    "market": ["segment"], "markets": ["segment"], "item": ["product"], "items": ["product"],
+    "products": ["product"], "when": ["date"], "rating": ["rating"], "ratings": ["rating"],
+    "stars": ["rating"], "star": ["rating"], "reviews": ["review"], "comment": ["review"],
+    "comments": ["review"], "feedback": ["review"], "branch": ["store"], "branches": ["store"],
+    "location": ["store", "address", "city"], "city": ["city", "address"],
+}
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "by", "per", "to", "and", "or", "is", "are", "was",
+    "what", "which", "show", "me", "how", "much", "many", "with", "from", "at", "all", "each", "none",
+}
+# Weights of the different kinds of evidence for a dataset
+NAME_WEIGHT = 1.5
+COLUMN_WEIGHT = 1.0
+VALUE_WEIGHT = 0.6
+SYNONYM_FACTOR = 0.8
+# A second dataset joins the answer when it scores this close to the best one on terms the best lacks
+JOIN_RATIO = 0.5
+
+
+def _words(text: str) -> list:
+    return [w for w in re.findall(r"[a-z0-9]+", str(text).lower()) if w not in STOPWORDS]
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+class DatasetIndex:
+    """
+    Inverted index from column names, synonyms and frequent categorical values to dataset keys.
+
+    ``route`` scores a question against every dataset with IDF-weighted term
+    matches and picks the best one, adding further datasets when the question
+    mentions things only they contain.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._keys = []
+
+    def add(self, key: str, profile: dict) -> None:
+        """
+        Index a dataset from its profile (see ``H_profile.profile_frame``).
+
+        :param key: The dataset key.
+        :param profile: The dataset's profile; column names and top values are indexed.
+        """
+        self.remove(key)
+        self._keys.append(key)
+        terms = {}
+
+        def note(term: str, weight: float) -> None:
+            term = _stem(term)
+            terms[term] = max(terms.get(term, 0.0), weight)
+
+        for word in _words(key.rsplit(".", 1)[0]):
+            note(word, NAME_WEIGHT)
+        for col, entry in profile["columns"].items():
+            for word in _words(col):
+                note(word, COLUMN_WEIGHT)
+            for value in entry.get("top", {}):
+                for word in _words(value):
+                    if not word.isdigit():
+                        note(word, VALUE_WEIGHT)
+
+        for term, weight in terms.items():
+            self._postings.setdefault(term, {})[key] = weight
+
+    def remove(self, key: str) -> None:
+        """Drop a dataset from the index."""
+        if key not in self._keys:
+            return
+        self._keys.remove(key)
+        for term in list(self._postings):
+            self._postings[term].pop(key, None)
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def _query_terms(self, query: str) -> dict:
+        terms = {}
+        for word in _words(query):
+            terms[_stem(word)] = 1.0
+            for synonym in SYNONYMS.get(word, []):
+                terms.setdefault(_stem(synonym), SYNONYM_FACTOR)
+        return terms
+
+    def score(self, query: str) -> dict:
+        """Return each dataset's score for ``query`` together with the terms that matched it."""
+        scores = {key: [0.0, set()] for key in self._keys}
+        total = len(self._keys)
+        for term, factor in self._query_terms(query).items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + total / len(postings))
+            for key, weight in postings.items():
+                scores[key][0] += factor * weight * idf
+                scores[key][1].add(term)
+        return {key: (value, terms) for key, (value, terms) in scores.items()}
+
+    def route(self, query: str) -> list:
+        """
+        Pick the dataset(s) a question is about.
+
+        :param query: The user's question.
+        :return: The best-scoring dataset key first, followed by any datasets needed
+                 for terms the best one does not cover; empty if nothing is indexed.
+        """
+        if len(self._keys) <= 1:
+            return list(self._keys)
+        scores = self.score(query)
+        ranked = sorted(self._keys, key=lambda key: -scores[key][0])
+        best = ranked[0]
+        best_score, covered = scores[best]
+        if best_score == 0:
+            return [best]
+
+        chosen = [best]
+        for key in ranked[1:]:
+            value, terms = scores[key]
+            if value >= JOIN_RATIO * best_score and terms - covered:
+                chosen.append(key)
+                covered = covered | terms
+        return chosen
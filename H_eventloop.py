@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the process-wide event loop, starting it on a daemon thread on first use.
+
+    Every caller submits to this one loop, so concurrent sessions overlap their
+    network waits instead of each holding a thread blocked on I/O.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True)
+            thread.start()
+            _loop = loop
+            logging.info("Started shared agent event loop.")
+        return _loop
+
+
+def submit(coro) -> concurrent.futures.Future:
+    """Schedule a coroutine on the shared loop and return a thread-safe future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def run(coro, timeout: float = None):
+    """Run a coroutine on the shared loop and block the calling thread until it finishes."""
+    return submit(coro).result(timeout)
+
+
+def iterate(agen):
+    """Consume an async generator on the shared loop, yielding its items synchronously."""
+    try:
+        while True:
+            try:
+                item = run(agen.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        run(agen.aclose())
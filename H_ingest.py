@@ -0,0 +1,145 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from H_datahandle import DataHandler
+
+INGEST_ROOT = os.getenv("INGEST_ROOT", "user_data")
+SUPPORTED_EXTENSIONS = {".csv", ".xls", ".xlsx"}
+# Finished jobs remembered across all users; in-flight jobs are always kept
+MAX_FINISHED_JOBS = int(os.getenv("INGEST_JOB_HISTORY", 200))
+
+# Progress shown for each status
+PROGRESS = {"queued": 0.1, "parsing": 0.4, "preprocessing": 0.7, "ready": 1.0, "failed": 1.0}
+
+
+class IngestJob:
+    """An uploaded file and the state of its background conversion."""
+
+    def __init__(self, name: str, digest: str, path: str):
+        self.name = name
+        self.digest = digest
+        self.path = path
+        self.status = "queued"
+        self.error = None
+        self.rows = None
+        self.seconds = None
+
+    @property
+    def progress(self) -> float:
+        return PROGRESS[self.status]
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("ready", "failed")
+
+
+class Ingestor:
+    """
+    Stores uploads per user under their content hash and warms them in the background.
+
+    A file whose bytes are already stored is neither written nor converted
+    again. New files are parsed, schema-converted and written to the dataset
+    cache by a worker thread, so the first question about them reads the
+    prepared columnar cache instead of the raw upload. Only the most recently
+    used ``MAX_FINISHED_JOBS`` finished jobs are remembered; a file uploaded
+    again after its job was dropped is reconverted from the dataset cache.
+    """
+
+    def __init__(self, root: str = None, workers: int = None):
+        """
+        :param root: The folder holding ``<user>/uploads`` (``INGEST_ROOT``, default ``user_data``).
+        :param workers: Conversion threads (``INGEST_WORKERS``, default 2).
+        """
+        self.root = root or INGEST_ROOT
+        workers = workers if workers is not None else int(os.getenv("INGEST_WORKERS", 2))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def upload_dir(self, username: str) -> str:
+        return os.path.join(self.root, username, "uploads")
+
+    def ingest(self, username: str, name: str, data) -> IngestJob:
+        """
+        Store an upload and schedule its conversion, unless the same bytes were ingested before.
+
+        :param username: The uploading user; each user has their own store.
+        :param name: The original file name, used as the dataset key.
+        :param data: The file contents (bytes or a buffer).
+        :return: The file's job, new or existing.
+        """
+        _, ext = os.path.splitext(name)
+        ext = ext.lower()
+        if ext not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file extension for {name}: {ext}")
+        digest = hashlib.sha256(data).hexdigest()
+        job_key = (username, name, digest)
+        with self._lock:
+            job = self._jobs.get(job_key)
+            # A failed conversion is retried when the file is uploaded again
+            if job is not None and job.status != "failed":
+                self._jobs.move_to_end(job_key)
+                return job
+            folder = self.upload_dir(username)
+            path = os.path.join(folder, f"{digest}{ext}")
+            job = IngestJob(name, digest, path)
+            self._jobs[job_key] = job
+            self._jobs.move_to_end(job_key)
+            self._prune()
+
+        if os.path.exists(path):
+            logging.info(f"Upload {name} already stored as {digest[:12]}.")
+        else:
+            os.makedirs(folder, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self._executor.submit(self._warm, job)
+        return job
+
+    def _warm(self, job: IngestJob) -> None:
+        started = time.perf_counter()
+        handler = DataHandler(dataset_paths={job.name: job.path})
+        try:
+            job.status = "parsing"
+            handler.load_data()
+            job.status = "preprocessing"
+            handler.preprocess_data()
+            job.rows = len(handler.get_data(job.name))
+            job.status = "ready"
+        except Exception as e:
+            logging.error(f"Could not ingest {job.name}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            handler.close()
+            job.seconds = time.perf_counter() - started
+
+    def _prune(self) -> None:
+        """Forget the least recently used finished jobs beyond ``MAX_FINISHED_JOBS``; call with the lock held."""
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[key]
+
+    def jobs(self, username: str) -> list:
+        """Return ``username``'s remembered jobs, least recently uploaded first."""
+        with self._lock:
+            return [job for (user, _, _), job in self._jobs.items() if user == username]
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor() -> Ingestor:
+    """Return the process-wide Ingestor."""
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            _ingestor = Ingestor()
+        return _ingestor
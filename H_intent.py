@@ -0,0 +1,247 @@
+import os
+import re
+import csv
+import sys
+import json
+import math
+import logging
+import threading
+from collections import Counter
+
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "intent_model.json")
+# Direct dispatch happens only at or above this confidence; everything else goes to the supervisor
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", 0.8))
+# Labeled examples needed before the trained model replaces the keyword rules
+MIN_TRAINING_EXAMPLES = 30
+
+LABELS = ("data", "summary", "agent")
+
+DATA_KEYWORDS = {
+    "sum", "total", "average", "avg", "mean", "median", "count", "how", "many", "much", "max", "maximum",
+    "min", "minimum", "highest", "lowest", "top", "bottom", "largest", "smallest", "group", "per", "each",
+    "by", "compare", "trend", "distribution", "plot", "chart", "graph", "histogram", "filter", "rows",
+    "column", "columns", "percentage", "ratio", "growth", "correlation", "std", "variance", "rank",
+}
+SUMMARY_KEYWORDS = {"summarize", "summarise", "summary", "condense", "shorten", "tldr", "recap", "paraphrase"}
+# Questions that lean on earlier turns need the supervisor's conversation memory
+CONTEXT_KEYWORDS = {"previous", "earlier", "above", "again", "same", "that", "those", "it", "last", "before"}
+MULTI_STEP_MARKERS = ("and then", "after that", "then ", "first ", "step by step", "as well as", " also ")
+# A summary request shorter than this, without a "summarize: ..." colon, has no text of its own to summarize
+INLINE_TEXT_WORDS = 25
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list:
+    return _WORD.findall(text.lower())
+
+
+def column_matches(question: str, columns) -> int:
+    """Count the dataset columns a question names, matching ``gross_sales`` to "gross sales"."""
+    tokens = tokenize(question)
+    phrases = {"_".join(tokens[i:i + n]) for n in (1, 2, 3) for i in range(len(tokens) - n + 1)}
+    return sum(1 for column in columns if str(column).lower() in phrases)
+
+
+def features(question: str, columns=()) -> list:
+    """The words and bigrams of a question, plus markers for keyword classes and column mentions."""
+    tokens = tokenize(question)
+    feats = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    words = set(tokens)
+    feats += ["__data_kw__"] * len(words & DATA_KEYWORDS)
+    feats += ["__summary_kw__"] * len(words & SUMMARY_KEYWORDS)
+    feats += ["__context_kw__"] * len(words & CONTEXT_KEYWORDS)
+    feats += ["__multi_step__"] * sum(marker in f" {question.lower()} " for marker in MULTI_STEP_MARKERS)
+    feats += ["__column__"] * column_matches(question, columns)
+    return feats
+
+
+def has_inline_text(question: str) -> bool:
+    """Return True if a summary request carries the text to summarize rather than pointing at the conversation."""
+    _, colon, after = question.partition(":")
+    if colon and len(tokenize(after)) >= 3:
+        return True
+    return "\n" in question.strip() or len(tokenize(question)) >= INLINE_TEXT_WORDS
+
+
+def rule_intent(question: str, columns=()) -> tuple:
+    """Keyword and column-match rules used until a model is trained; return ``(label, confidence)``."""
+    lowered = f" {question.lower()} "
+    words = set(tokenize(question))
+    if words & CONTEXT_KEYWORDS or any(marker in lowered for marker in MULTI_STEP_MARKERS):
+        return "agent", 0.9
+    data_signal = bool(words & DATA_KEYWORDS)
+    column_signal = column_matches(question, columns) > 0
+    if words & SUMMARY_KEYWORDS:
+        return ("summary", 0.9) if not column_signal else ("agent", 0.6)
+    if data_signal and column_signal:
+        return "data", 0.9
+    if data_signal or column_signal:
+        return "data", 0.6
+    return "agent", 0.5
+
+
+class IntentClassifier:
+    """
+    Decides whether a question can skip the ReAct supervisor.
+
+    ``data`` questions go straight to the PandasAgent and ``summary`` requests to
+    the SummaryAgent; ``agent`` (ambiguous, multi-step or conversational)
+    questions keep the full supervisor. Until enough labeled examples are
+    available, keyword and column-match rules decide; after that, a
+    multinomial naive Bayes model trained on the supervisor's own past tool
+    choices does.
+    """
+
+    def __init__(self, path: str = None, threshold: float = None):
+        """
+        :param path: The trained model file (``INTENT_MODEL_PATH``, default ``intent_model.json``).
+        :param threshold: The confidence needed for direct dispatch (``INTENT_THRESHOLD``, default 0.8).
+        """
+        self.path = path or INTENT_MODEL_PATH
+        self.threshold = INTENT_THRESHOLD if threshold is None else threshold
+        self.label_counts = Counter()
+        self.feature_counts = {label: Counter() for label in LABELS}
+        if os.path.exists(self.path):
+            self.load(self.path)
+
+    @property
+    def trained(self) -> bool:
+        return sum(self.label_counts.values()) >= MIN_TRAINING_EXAMPLES
+
+    def train(self, examples) -> int:
+        """
+        Add labeled examples to the model.
+
+        :param examples: ``(question, label)`` or ``(question, label, columns_named)`` tuples, where
+                         ``columns_named`` counts the dataset columns the question mentioned;
+                         labels outside ``LABELS`` are skipped.
+        :return: The number of examples used.
+        """
+        used = 0
+        for question, label, *rest in examples:
+            if label not in LABELS or not question:
+                continue
+            feats = features(question) + ["__column__"] * int(rest[0] if rest else 0)
+            self.label_counts[label] += 1
+            self.feature_counts[label].update(feats)
+            used += 1
+        return used
+
+    def _posterior(self, feats: list) -> dict:
+        total = sum(self.label_counts.values())
+        vocabulary = len(set().union(*self.feature_counts.values())) or 1
+        scores = {}
+        for label in LABELS:
+            counts = self.feature_counts[label]
+            denominator = sum(counts.values()) + vocabulary
+            score = math.log((self.label_counts[label] + 1) / (total + len(LABELS)))
+            score += sum(math.log((counts[f] + 1) / denominator) for f in feats)
+            scores[label] = score
+        top = max(scores.values())
+        exp = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp.values())
+        return {label: value / norm for label, value in exp.items()}
+
+    def classify(self, question: str, columns=()) -> tuple:
+        """Return ``(label, confidence)`` for a question about datasets with the given columns."""
+        if not self.trained:
+            return rule_intent(question, columns)
+        posterior = self._posterior(features(question, columns))
+        label = max(posterior, key=posterior.get)
+        return label, posterior[label]
+
+    def route(self, question: str, columns=()) -> str:
+        """Return where to send the question: ``data``, ``summary`` or ``agent``."""
+        label, confidence = self.classify(question, columns)
+        return label if confidence >= self.threshold else "agent"
+
+    def save(self, path: str = None) -> None:
+        path = path or self.path
+        model = {"label_counts": self.label_counts, "feature_counts": self.feature_counts}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(model, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            model = json.load(f)
+        self.label_counts = Counter(model["label_counts"])
+        self.feature_counts = {label: Counter(model["feature_counts"].get(label, {})) for label in LABELS}
+
+
+def examples_from_traces(path: str) -> list:
+    """
+    Label past supervisor turns in a trace file by the tools the supervisor chose.
+
+    A turn that called only ``pandas_agent`` or ``sql_agent`` is ``data``, one that called
+    only ``summary_agent`` is ``summary``, and anything else is ``agent``. Directly
+    dispatched turns are skipped so the model only learns from the supervisor.
+    """
+    turns, tools = {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if span["stage"] == "turn":
+                attrs = span.get("attrs", {})
+                if attrs.get("question") and attrs.get("route", "agent") == "agent" and not attrs.get("cached"):
+                    turns[span["span_id"]] = (attrs["question"], attrs.get("columns_named", 0))
+            elif span["stage"] == "tool":
+                tools.setdefault(span["parent_id"], []).append(span["name"])
+    examples = []
+    for span_id, (question, columns_named) in turns.items():
+        called = set(tools.get(span_id, []))
+        called_count = len(tools.get(span_id, []))
+        if called_count == 1 and called <= {"pandas_agent", "sql_agent"}:
+            label = "data"
+        elif called_count == 1 and called == {"summary_agent"}:
+            label = "summary"
+        else:
+            label = "agent"
+        examples.append((question, label, columns_named))
+    return examples
+
+
+def load_examples(path: str) -> list:
+    """
+    Read training examples from a trace file, or hand-labeled ones from a JSONL or
+    ``question,label`` CSV file.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            return [(row["question"], row["label"]) for row in csv.DictReader(f)]
+        items = [json.loads(line) for line in f if line.strip()]
+    if items and "stage" in items[0]:
+        return examples_from_traces(path)
+    return [(item["question"], item["label"], item.get("columns_named", 0)) for item in items]
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier():
+    """Return the process-wide IntentClassifier, or None when ``INTENT_ROUTING=0``."""
+    global _classifier
+    if os.getenv("INTENT_ROUTING", "1") == "0":
+        return None
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = IntentClassifier()
+        return _classifier
+
+
+if __name__ == "__main__":
+    # Train from trace files and labeled examples: python H_intent.py traces.jsonl [labels.csv ...]
+    logging.basicConfig(level=logging.INFO)
+    classifier = IntentClassifier()
+    for path in sys.argv[1:] or [os.getenv("TRACE_FILE", "traces.jsonl")]:
+        examples = load_examples(path)
+        used = classifier.train(examples)
+        logging.info(f"{path}: {used} examples ({dict(Counter(example[1] for example in examples))}).")
+    classifier.save()
+    print(f"Saved {sum(classifier.label_counts.values())} examples to {classifier.path}.")
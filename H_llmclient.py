@@ -0,0 +1,251 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+import httpx
+from langchain_openai import ChatOpenAI
+
+# Requests per second (and burst) allowed per endpoint and API key; 0 disables the limiter
+LLM_RATE = float(os.getenv("LLM_RATE", 5))
+LLM_BURST = int(os.getenv("LLM_BURST", 0)) or max(1, int(LLM_RATE))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Backoff before retry n is drawn from [0, min(RETRY_MAX_WAIT, RETRY_BASE_WAIT * 2**n)]
+RETRY_BASE_WAIT = 0.5
+RETRY_MAX_WAIT = 30.0
+
+
+class TokenBucket:
+    """A thread-safe token bucket; callers reserve a token and are told how long to wait for it."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, possibly from the future, and return the seconds until it is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class ClientMetrics:
+    """Counts requests, retries and time spent queued in the limiter, per endpoint and key."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, wait: float = 0.0, retry: bool = False, status: int = None) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(
+                key, {"requests": 0, "retries": 0, "throttled": 0, "queue_wait": 0.0, "max_queue_wait": 0.0}
+            )
+            if retry:
+                entry["retries"] += 1
+                entry["throttled"] += status == 429
+            else:
+                entry["requests"] += 1
+                entry["queue_wait"] += wait
+                entry["max_queue_wait"] = max(entry["max_queue_wait"], wait)
+
+    def stats(self) -> dict:
+        """Return ``{endpoint key: {"requests", "retries", "throttled", "queue_wait", "max_queue_wait"}}``."""
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._stats.items()}
+
+
+def retry_delay(response, attempt: int) -> float:
+    """Jittered exponential backoff, but never less than the server's ``Retry-After`` (None for network errors)."""
+    delay = random.uniform(0, min(RETRY_MAX_WAIT, RETRY_BASE_WAIT * 2 ** attempt))
+    if response is None:
+        return delay
+    try:
+        delay = max(delay, min(RETRY_MAX_WAIT, float(response.headers.get("retry-after", 0))))
+    except ValueError:
+        pass
+    return delay
+
+
+class _Limiter:
+    """Shared state of the sync and async transports: one bucket per endpoint and key."""
+
+    def __init__(self, rate: float, burst: int, max_retries: int, metrics: ClientMetrics):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def key(self, request: httpx.Request) -> str:
+        # Only a digest of the key is kept, so it never shows up in metrics or logs
+        auth = request.headers.get("authorization", "")
+        return f"{request.url.host}:{hashlib.sha256(auth.encode()).hexdigest()[:8]}"
+
+    def reserve(self, key: str) -> float:
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket.reserve()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """Wraps a pooled transport with the per-key limiter and retries on 429/5xx and network errors."""
+
+    def __init__(self, transport: httpx.BaseTransport, limiter: _Limiter):
+        self._transport = transport
+        self._limiter = limiter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = self._limiter.key(request)
+        wait = self._limiter.reserve(key)
+        if wait:
+            time.sleep(wait)
+        self._limiter.metrics.record(key, wait)
+        for attempt in range(self._limiter.max_retries + 1):
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                if attempt == self._limiter.max_retries:
+                    raise
+                delay = retry_delay(None, attempt)
+                self._limiter.metrics.record(key, retry=True)
+                logging.warning(f"LLM request to {request.url.host} failed ({type(e).__name__}); retrying in {delay:.2f}s.")
+                time.sleep(delay + self._limiter.reserve(key))
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self._limiter.max_retries:
+                return response
+            delay = retry_delay(response, attempt)
+            response.close()
+            self._limiter.metrics.record(key, retry=True, status=response.status_code)
+            logging.warning(f"LLM request to {request.url.host} got {response.status_code}; retrying in {delay:.2f}s.")
+            time.sleep(delay + self._limiter.reserve(key))
+        return response
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Asynchronous counterpart of ``RateLimitedTransport``; waits without blocking the event loop."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: _Limiter):
+        self._transport = transport
+        self._limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = self._limiter.key(request)
+        wait = self._limiter.reserve(key)
+        if wait:
+            await asyncio.sleep(wait)
+        self._limiter.metrics.record(key, wait)
+        for attempt in range(self._limiter.max_retries + 1):
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt == self._limiter.max_retries:
+                    raise
+                delay = retry_delay(None, attempt)
+                self._limiter.metrics.record(key, retry=True)
+                logging.warning(f"LLM request to {request.url.host} failed ({type(e).__name__}); retrying in {delay:.2f}s.")
+                await asyncio.sleep(delay + self._limiter.reserve(key))
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self._limiter.max_retries:
+                return response
+            delay = retry_delay(response, attempt)
+            await response.aclose()
+            self._limiter.metrics.record(key, retry=True, status=response.status_code)
+            logging.warning(f"LLM request to {request.url.host} got {response.status_code}; retrying in {delay:.2f}s.")
+            await asyncio.sleep(delay + self._limiter.reserve(key))
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class LLMClientFactory:
+    """
+    Builds every ChatOpenAI in the process on one pair of pooled HTTP clients.
+
+    Connections are kept alive and shared across agents, so TLS handshakes are
+    paid once per host rather than per client. All requests pass through a
+    token bucket per endpoint and API key, and 429/5xx replies and network
+    errors (connect/read failures and timeouts) are retried with jittered
+    exponential backoff here, so the OpenAI SDK's own retries are off.
+    """
+
+    def __init__(self, rate: float = None, burst: int = None, max_retries: int = None, max_connections: int = None):
+        """
+        :param rate: Requests per second per endpoint and key (``LLM_RATE``, default 5; 0 = unlimited).
+        :param burst: Requests allowed at once before the rate applies (``LLM_BURST``, default ``rate``).
+        :param max_retries: Retries on 429/5xx and network errors (``LLM_MAX_RETRIES``, default 3).
+        :param max_connections: Size of the keep-alive pool (``LLM_MAX_CONNECTIONS``, default 20).
+        """
+        self.metrics = ClientMetrics()
+        self._limiter = _Limiter(
+            LLM_RATE if rate is None else rate,
+            LLM_BURST if burst is None else burst,
+            LLM_MAX_RETRIES if max_retries is None else max_retries,
+            self.metrics,
+        )
+        limits = httpx.Limits(
+            max_connections=max_connections or LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=max_connections or LLM_MAX_CONNECTIONS,
+            keepalive_expiry=60,
+        )
+        self.http_client = httpx.Client(
+            transport=RateLimitedTransport(httpx.HTTPTransport(limits=limits), self._limiter),
+        )
+        # The async client's connections belong to the shared event loop (H_eventloop)
+        self.http_async_client = httpx.AsyncClient(
+            transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(limits=limits), self._limiter),
+        )
+
+    def chat_model(self, base_url: str, model: str, api_key: str, temperature: float, **kwargs) -> ChatOpenAI:
+        """Return a ChatOpenAI that sends its requests through the shared clients."""
+        return ChatOpenAI(
+            base_url=base_url,
+            model=model,
+            api_key=api_key,
+            temperature=temperature,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            max_retries=0,
+            **kwargs,
+        )
+
+    def stats(self) -> dict:
+        return self.metrics.stats()
+
+
+_factory = None
+_factory_lock = threading.Lock()
+
+
+def get_llm_factory() -> LLMClientFactory:
+    """Return the process-wide LLMClientFactory."""
+    global _factory
+    with _factory_lock:
+        if _factory is None:
+            _factory = LLMClientFactory()
+        return _factory
+
+
+def chat_model(base_url: str, model: str, api_key: str, temperature: float, **kwargs) -> ChatOpenAI:
+    """Build a ChatOpenAI on the process-wide pooled, rate-limited HTTP clients."""
+    return get_llm_factory().chat_model(base_url, model, api_key, temperature, **kwargs)
@@ -0,0 +1,136 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from pydantic import PrivateAttr
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import SystemMessage, get_buffer_string
+
+# Rough characters-per-token ratio used for the memory budget
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = (
+    "Progressively summarize the conversation between a user and a data-analysis assistant, "
+    "adding the new lines to the existing summary. Keep numbers, dataset names and open "
+    "questions; drop pleasantries. Return only the new summary.\n\n"
+    "Current summary:\n{summary}\n\nNew lines of conversation:\n{new_lines}\n\nNew summary:"
+)
+
+# Folding runs here, off the request path; a per-memory lock keeps each memory's folds in order
+_summarizer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+def _count_tokens(messages: list) -> int:
+    return sum(len(message.content) for message in messages) // CHARS_PER_TOKEN
+
+
+class RollingSummaryMemory(BaseChatMemory):
+    """
+    Conversation memory with a token budget.
+
+    The last ``keep_turns`` turns stay verbatim. Older turns, and any turns that
+    push the verbatim part over ``max_token_limit``, are folded into a running
+    summary by a background thread; until a fold finishes those turns are
+    still returned verbatim, so nothing is lost while it runs. If the fold
+    fails, the oldest unfolded turns are dropped to stay within the budget.
+    """
+
+    llm: BaseLanguageModel
+    memory_key: str = "chat_history"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    max_token_limit: int = int(os.getenv("MEMORY_TOKEN_BUDGET", 1500))
+    keep_turns: int = int(os.getenv("MEMORY_KEEP_TURNS", 4))
+    summary: str = ""
+
+    _pending: list = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _fold_lock: Any = PrivateAttr(default_factory=threading.Lock)
+    # Bumped by clear(), so a fold that started before it does not write back
+    _generation: int = PrivateAttr(default=0)
+
+    @property
+    def memory_variables(self) -> list:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: dict) -> dict:
+        """Return the summary (as a system message) followed by the unfolded and recent turns."""
+        with self._lock:
+            messages = list(self._pending) + list(self.chat_memory.messages)
+            summary = self.summary
+        if summary:
+            messages = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] + messages
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)}
+
+    def save_context(self, inputs: dict, outputs: dict) -> None:
+        """Record a turn and schedule a fold when the verbatim part is over budget."""
+        super().save_context(inputs, outputs)
+        evicted = self._evict_old_turns()
+        if evicted:
+            _summarizer.submit(self._fold)
+
+    async def asave_context(self, inputs: dict, outputs: dict) -> None:
+        """Asynchronous ``save_context``; the same budget applies to turns saved from ``ainvoke`` and streams."""
+        await asyncio.to_thread(self.save_context, inputs, outputs)
+
+    def _evict_old_turns(self) -> bool:
+        with self._lock:
+            messages = self.chat_memory.messages
+            keep = 2 * max(self.keep_turns, 1)
+            cut = max(len(messages) - keep, 0)
+            # Over budget: fold further, but always keep the latest turn verbatim
+            while cut < len(messages) - 2 and _count_tokens(messages[cut:]) > self.max_token_limit:
+                cut += 2
+            if cut == 0:
+                return False
+            self._pending.extend(messages[:cut])
+            self.chat_memory.messages = messages[cut:]
+            return True
+
+    def _fold(self) -> None:
+        with self._fold_lock:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.summary
+                generation = self._generation
+            if not batch:
+                return
+            prompt = SUMMARY_PROMPT.format(
+                summary=summary or "(none)",
+                new_lines=get_buffer_string(batch, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix),
+            )
+            try:
+                response = self.llm.invoke(prompt)
+                new_summary = getattr(response, "content", response)
+            except Exception as e:
+                logging.error(f"Error while summarizing conversation memory: {e}")
+                with self._lock:
+                    if self._generation == generation:
+                        self._trim_pending()
+                return
+            with self._lock:
+                if self._generation != generation:
+                    return
+                self.summary = str(new_summary).strip()
+                del self._pending[:len(batch)]
+
+    def _trim_pending(self) -> None:
+        """Drop the oldest unfolded turns until they fit ``max_token_limit`` (lock held)."""
+        while self._pending and _count_tokens(self._pending) > self.max_token_limit:
+            del self._pending[:2]
+
+    def clear(self) -> None:
+        """Forget the conversation, including the summary."""
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self._pending.clear()
+            self._generation += 1
+
+    async def aclear(self) -> None:
+        await asyncio.to_thread(self.clear)
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatResult
+from H_llmclient import chat_model
+from H_tracing import aggregate
+
+DEFAULT_BASE_URL = "https://api.opentyphoon.ai/v1"
+
+# Models offered in the app. ``cost`` is relative per token; ``fallback`` is where hedged
+# requests go (None: not hedged). Entries may also set ``base_url`` and ``api_key_env``.
+DEFAULT_CATALOG = {
+    "typhoon-v1.5x-70b-instruct": {"label": "Typhoon 1.5X 70B", "cost": 1.0, "fallback": "typhoon-v1.5-instruct"},
+    "typhoon-v1.5-instruct": {"label": "Typhoon 1.5 8B", "cost": 0.2, "fallback": None},
+}
+
+# API key used by each role unless the catalog entry names its own
+ROLE_API_KEYS = {"supervisor": "TYPHOON_API_KEY", "pandas": "PANDAS_API_KEY", "summary": "PLOT_API_KEY"}
+# Roles whose calls go to the cheapest model that is not measurably slower than the chosen one
+CHEAP_ROLES = {"summary"}
+
+# Latency samples kept per model, and how many are needed before p95 is trusted for hedging
+LATENCY_WINDOW = int(os.getenv("ROUTER_LATENCY_WINDOW", 200))
+MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", 20))
+HEDGING = os.getenv("ROUTER_HEDGING", "1") != "0"
+
+# Synchronous hedged calls wait on these threads; losing requests finish here in the background
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ROUTER_HEDGE_THREADS", 32)),
+                                     thread_name_prefix="hedge")
+
+
+def load_catalog(path: str = None) -> dict:
+    """Read the model catalog from ``MODEL_CATALOG`` (a JSON file), or return the default one."""
+    path = path or os.getenv("MODEL_CATALOG")
+    if not path:
+        return DEFAULT_CATALOG
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ModelRouter:
+    """
+    Chooses a model per agent role and measures every model's latency on live traffic.
+
+    The supervisor and pandas roles use the model the user picked. Summaries go
+    to the cheapest catalog model whose measured p95 is no worse than the
+    picked model's. The measurements also set the hedging threshold of each
+    ``HedgedChatModel``.
+    """
+
+    def __init__(self, catalog: dict = None, base_url: str = None):
+        """
+        :param catalog: ``{model: {"label", "cost", "fallback", "base_url", "api_key_env"}}``
+                        (``load_catalog()`` by default).
+        :param base_url: The endpoint of entries without their own ``base_url``.
+        """
+        self.catalog = catalog or load_catalog()
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self._samples = {}
+        self._hedges = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def models(self) -> list:
+        """Return the catalog's model names, for the model picker."""
+        return list(self.catalog)
+
+    def label(self, model: str) -> str:
+        return self.catalog.get(model, {}).get("label", model)
+
+    def observe(self, model: str, metric: str, seconds: float) -> None:
+        """Record one ``latency`` (whole call) or ``first_token`` (streamed) measurement for ``model``."""
+        with self._lock:
+            samples = self._samples.get((model, metric))
+            if samples is None:
+                samples = self._samples[(model, metric)] = deque(maxlen=LATENCY_WINDOW)
+            samples.append(seconds)
+
+    def percentile(self, model: str, metric: str = "latency", q: str = "p95"):
+        """Return the measured p50 or p95 of ``model``, or None until enough samples exist."""
+        with self._lock:
+            samples = list(self._samples.get((model, metric), ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return aggregate([{"stage": metric, "duration": s} for s in samples])[metric][q]
+
+    def route(self, role: str, model: str) -> str:
+        """Return the model that serves ``role`` when the user picked ``model``."""
+        if role not in CHEAP_ROLES:
+            return model
+        picked_p95 = self.percentile(model)
+        candidates = []
+        for name, entry in self.catalog.items():
+            p95 = self.percentile(name)
+            if name != model and picked_p95 is not None and p95 is not None and p95 > picked_p95:
+                continue
+            candidates.append((entry.get("cost", 1.0), p95 if p95 is not None else float("inf"), name))
+        return min(candidates)[2] if candidates else model
+
+    def fallback(self, model: str):
+        """Return the model hedged requests to ``model`` go to, or None when it has no distinct fallback."""
+        fallback = self.catalog.get(model, {}).get("fallback")
+        return fallback if fallback and fallback != model else None
+
+    def client(self, role: str, model: str, temperature: float):
+        """Return the (shared) ChatOpenAI that calls ``model`` on behalf of ``role``."""
+        key = (role, model, float(temperature))
+        with self._lock:
+            llm = self._models.get(key)
+            if llm is None:
+                entry = self.catalog.get(model, {})
+                api_key_env = entry.get("api_key_env") or ROLE_API_KEYS[role]
+                api_key = os.getenv(api_key_env)
+                if not api_key:
+                    raise ValueError(f"API key is missing. Ensure '{api_key_env}' is set in your environment.")
+                llm = chat_model(
+                    base_url=entry.get("base_url") or self.base_url,
+                    model=model,
+                    api_key=api_key,
+                    temperature=temperature,
+                )
+                self._models[key] = llm
+            return llm
+
+    def record_hedge(self, role: str, won: bool) -> None:
+        with self._lock:
+            entry = self._hedges.setdefault(role, {"hedged": 0, "hedge_won": 0})
+            entry["hedged"] += 1
+            entry["hedge_won"] += won
+
+    def stats(self) -> list:
+        """Return one row per model and metric with its samples, p50 and p95, plus hedge counts per role."""
+        with self._lock:
+            samples = {key: list(values) for key, values in self._samples.items()}
+            hedges = {role: dict(entry) for role, entry in self._hedges.items()}
+        rows = []
+        for (model, metric), values in sorted(samples.items()):
+            summary = aggregate([{"stage": metric, "duration": s} for s in values])[metric]
+            rows.append({"model": model, "metric": metric, "samples": len(values),
+                         "p50": summary["p50"], "p95": summary["p95"]})
+        for role, entry in hedges.items():
+            rows.append({"model": f"hedges ({role})", "metric": "hedged / won",
+                         "samples": entry["hedged"], "p50": None, "p95": entry["hedge_won"]})
+        return rows
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    A chat model for one agent role that routes each call and hedges slow ones.
+
+    Each call goes to the model the router picks for the role. If no reply (or,
+    when streaming, no first token) has arrived by that model's measured p95, the
+    same request is also sent to its fallback model and whichever answers first
+    is used. Until a model has enough measurements, its calls are not hedged.
+    """
+
+    router: Any
+    role: str
+    model_name: str
+    temperature: float = 0.1
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-router"
+
+    @property
+    def _identifying_params(self) -> dict:
+        # Traces name the model the call is routed to, not the one picked in the app
+        model = self.router.route(self.role, self.model_name)
+        return {"model_name": model, "picked_model": self.model_name, "role": self.role, "temperature": self.temperature}
+
+    def _plan(self, metric: str) -> tuple:
+        """Return ``(primary, secondary, threshold)``; secondary is None when the call is not hedged."""
+        primary = self.router.route(self.role, self.model_name)
+        secondary = self.router.fallback(primary) if HEDGING else None
+        threshold = self.router.percentile(primary, metric) if secondary is not None else None
+        return primary, secondary if threshold is not None else None, threshold
+
+    def _timed(self, model: str, messages, stop, kwargs) -> ChatResult:
+        started = time.perf_counter()
+        try:
+            result = self.router.client(self.role, model, self.temperature)._generate(messages, stop=stop, **kwargs)
+        finally:
+            # Failed calls count with the time they took, so a failing model does not look fast
+            self.router.observe(model, "latency", time.perf_counter() - started)
+        result.llm_output = {**(result.llm_output or {}), "routed_model": model}
+        return result
+
+    async def _atimed(self, model: str, messages, stop, kwargs) -> ChatResult:
+        started = time.perf_counter()
+        llm = self.router.client(self.role, model, self.temperature)
+        try:
+            result = await llm._agenerate(messages, stop=stop, **kwargs)
+        finally:
+            # A hedge loser is cancelled; its elapsed time is a lower bound on its latency, and
+            # dropping it would bias the p95 toward the requests that happened to be fast
+            self.router.observe(model, "latency", time.perf_counter() - started)
+        result.llm_output = {**(result.llm_output or {}), "routed_model": model}
+        return result
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        primary, secondary, threshold = self._plan("latency")
+        if secondary is None:
+            return self._timed(primary, messages, stop, kwargs)
+        # The losing request is left to finish in the background; its reply is discarded
+        first = _hedge_executor.submit(self._timed, primary, messages, stop, kwargs)
+        done, _ = wait([first], timeout=threshold)
+        if done and first.exception() is None:
+            return first.result()
+        logging.info(f"Hedging {self.role} call to {primary} with {secondary} after {threshold:.2f}s.")
+        second = _hedge_executor.submit(self._timed, secondary, messages, stop, kwargs)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.router.record_hedge(self.role, future is second)
+                    return future.result()
+        self.router.record_hedge(self.role, False)
+        return first.result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        primary, secondary, threshold = self._plan("latency")
+        if secondary is None:
+            return await self._atimed(primary, messages, stop, kwargs)
+        first = asyncio.ensure_future(self._atimed(primary, messages, stop, kwargs))
+        done, _ = await asyncio.wait([first], timeout=threshold)
+        if done and first.exception() is None:
+            return first.result()
+        logging.info(f"Hedging {self.role} call to {primary} with {secondary} after {threshold:.2f}s.")
+        second = asyncio.ensure_future(self._atimed(secondary, messages, stop, kwargs))
+        return await self._first_success(first, second)
+
+    async def _first_success(self, first, second):
+        """Return the result of whichever task succeeds first and cancel the other."""
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.router.record_hedge(self.role, task is second)
+                        return task.result()
+            self.router.record_hedge(self.role, False)
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Synchronous streams are not hedged; the sync agents call _generate instead
+        model = self.router.route(self.role, self.model_name)
+        started = time.perf_counter()
+        first = True
+        for chunk in self.router.client(self.role, model, self.temperature)._stream(messages, stop=stop, **kwargs):
+            if first:
+                self.router.observe(model, "first_token", time.perf_counter() - started)
+                chunk.message.response_metadata["routed_model"] = model
+                first = False
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        primary, secondary, threshold = self._plan("first_token")
+
+        async def open_stream(model: str):
+            # Start a stream and wait for its first chunk, which is what the hedge races on
+            started = time.perf_counter()
+            llm = self.router.client(self.role, model, self.temperature)
+            stream = llm._astream(messages, stop=stop, **kwargs)
+            try:
+                chunk = await stream.__anext__()
+            finally:
+                # Also recorded when the stream loses the hedge and is cancelled (a lower bound)
+                self.router.observe(model, "first_token", time.perf_counter() - started)
+            chunk.message.response_metadata["routed_model"] = model
+            return stream, chunk
+
+        first = asyncio.ensure_future(open_stream(primary))
+        if secondary is None:
+            stream, chunk = await first
+        else:
+            done, _ = await asyncio.wait([first], timeout=threshold)
+            if done and first.exception() is None:
+                stream, chunk = first.result()
+            else:
+                logging.info(f"Hedging {self.role} stream from {primary} with {secondary} after {threshold:.2f}s.")
+                second = asyncio.ensure_future(open_stream(secondary))
+                stream, chunk = await self._first_success(first, second)
+                # Both may have opened before the race was decided; the loser still holds a connection
+                for task in (first, second):
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        if task.result()[0] is not stream:
+                            await task.result()[0].aclose()
+        try:
+            yield chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Return the process-wide ModelRouter."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
@@ -1,15 +1,29 @@
 import os
-import pandas as pd
+import asyncio
 import logging
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
+from H_llmclient import chat_model
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
 from langchain.agents.agent_types import AgentType
+from langchain_core.tools import StructuredTool
 from H_datahandle import DataHandler
+from H_planner import QueryPlanner
+from H_profile import render_profile
+from H_sandbox import get_sandbox, format_result
+from H_resultcache import get_result_cache, binds_names
 import re
+import uuid
+
+# Token budget for the dataset profile placed in the agent prompt
+PROFILE_TOKEN_BUDGET = int(os.getenv("PROFILE_TOKEN_BUDGET", 600))
+# What ``run`` tells the supervisor when a question could not be answered
+ANALYSIS_ERROR = "An error occurred while analyzing the data."
+# How AgentExecutor's output starts when it gave up
+AGENT_STOPPED = "Agent stopped due to"
 
 class PandasAgent:
-    def __init__(self, temperature: float, base_url: str, model_name: str, dataset_paths: dict):
+    def __init__(self, temperature: float, base_url: str, model_name: str, dataset_paths: dict, llm=None):
         self.handler = DataHandler(dataset_paths=dataset_paths)
         self.handler.load_data()
         self.handler.preprocess_data()
@@ -18,75 +32,200 @@ class PandasAgent:
         self.base_url = base_url
         self.model_name = model_name
         self.api_key = os.getenv("PANDAS_API_KEY")
-        self.llm = self.initialize_llm()
+        # A routed model (H_modelrouter) can be passed in instead of a fixed one
+        self.llm = llm if llm is not None else self.initialize_llm()
+        self.planner = QueryPlanner()
+        self.sandbox = get_sandbox()
+        self.result_cache = get_result_cache()
 
     def initialize_llm(self) -> ChatOpenAI:
         """Initialize the language model."""
         if not self.api_key:
             raise ValueError("API key is missing. Ensure 'PANDAS_API_KEY' is set in your environment.")
-        return ChatOpenAI(
+        return chat_model(
             base_url=self.base_url,
             model=self.model_name,
             api_key=self.api_key,
             temperature=self.temperature,
         )
 
-    def create_agent(self, df_key: str):
-        """Create an agent for the specified dataset."""
-        if df_key not in self.handler._data:
-            raise ValueError(f"Dataset '{df_key}' not found.")
-        
-        df = self.handler.get_data(df_key)
+    def create_agent(self, df_key, run_id: str = None):
+        """
+        Create an agent for the specified dataset, or for several datasets given a list of keys.
+
+        Its sandboxed snippets share variables under ``run_id``; pass the same id to
+        ``end_run`` when the run is over.
+        """
+        keys = [df_key] if isinstance(df_key, str) else list(df_key)
+        for key in keys:
+            if key not in self.handler.keys():
+                raise ValueError(f"Dataset '{key}' not found.")
+
+        # The agent names a single frame `df` and several frames `df1`, `df2`, ...
+        names = {"df": keys[0]} if len(keys) == 1 else {f"df{i}": key for i, key in enumerate(keys, 1)}
+        budget = PROFILE_TOKEN_BUDGET // len(keys)
+        descriptions = []
+        for name, key in names.items():
+            profile = render_profile(self.handler.get_profile(key), budget)
+            # The agent formats the suffix as a template, so literal braces must be escaped
+            profile = profile.replace("{", "{{").replace("}", "}}")
+            descriptions.append(f"DataFrame `{name}` ({key}): {profile}")
         suffix = (
-            f"You are working with a DataFrame. Columns are: {', '.join(df.columns)}. "
+            "\n".join(descriptions) + "\n"
+            "These profiles already cover dtypes, nulls, ranges and common values, so do not "
+            "inspect them again with head(), dtypes or unique(). "
             "Use proper syntax to access and manipulate data."
         )
-        return create_pandas_dataframe_agent(
+        dfs = [self.handler.get_data(key) for key in keys]
+        agent = create_pandas_dataframe_agent(
             llm=self.llm,
-            df=df,
+            df=dfs[0] if len(dfs) == 1 else dfs,
             agent_type=AgentType.OPENAI_FUNCTIONS,
             suffix=suffix,
             verbose=True,
             allow_dangerous_code=True,  
         )
+        if self.sandbox is not None:
+            self.use_sandbox(agent, names, run_id or uuid.uuid4().hex)
+        return agent
+
+    def sandbox_datasets(self, names: dict) -> dict:
+        """Describe datasets to the sandbox; ``names`` maps variable names to dataset keys."""
+        datasets = {}
+        for name, key in names.items():
+            digest = self.handler.get_digest(key)
+            datasets[name] = {
+                "version": digest,
+                "path": self.handler.cache_path(digest),
+                "frame": lambda key=key: self.handler.get_data(key),
+            }
+        return datasets
+
+    def use_sandbox(self, agent, names: dict, run_id: str) -> None:
+        """Replace the agent's in-process Python tool with one that runs code in the sandbox under ``run_id``."""
+        datasets = self.sandbox_datasets(names)
+        state = {"bound": False}
+
+        def run_code(query: str) -> str:
+            # Once the run has defined variables, results depend on them and are no longer cached
+            binds = binds_names(query)
+            cached = not (state["bound"] or binds)
+            state["bound"] = state["bound"] or binds
+            return format_result(self.run_in_sandbox(query, datasets, run_id, cached))
+
+        async def arun_code(query: str) -> str:
+            return await asyncio.to_thread(run_code, query)
+
+        agent.tools = [
+            StructuredTool.from_function(
+                func=run_code,
+                coroutine=arun_code,
+                name=tool.name,
+                description=tool.description,
+                args_schema=tool.args_schema,
+            )
+            if tool.name == "python_repl_ast"
+            else tool
+            for tool in agent.tools
+        ]
+
+    def run_in_sandbox(self, code: str, datasets: dict, run_id: str = None, cached: bool = True) -> dict:
+        """Run code in the sandbox, reusing the result of an identical snippet on the same data when ``cached``."""
+        if self.result_cache is None or not cached:
+            return self.sandbox.execute(code, datasets, run_id=run_id)
+        return self.result_cache.execute(self.sandbox, code, datasets, run_id)
+
+    def end_run(self, run_id: str) -> None:
+        """Free the sandbox variables of an agent run."""
+        if self.sandbox is not None:
+            self.sandbox.end_run(run_id)
 
     def extract_code_snippet(self, response: str) -> str:
         """Extract Python code from agent response."""
         match = re.search(r'```(?:python|code)?\n(.*?)\n```', response, re.DOTALL)
         return match.group(1).strip() if match else response.strip()
 
-    def execute_code(self, code: str, context: dict):
-        """Safely execute Python code."""
-        try:
-            exec(code, context)
-        # except Exception as e:
-        #     logging.error(f"Error executing code: {e}")
-        except:
-            pass
+    def execute_code(self, code: str, df_key: str) -> dict:
+        """
+        Execute Python code against a dataset in the sandbox.
 
-    def run(self, query: str):
-        """Handle user interactions."""
-        logging.info("Available datasets: %s", ", ".join(self.handler._data.keys()))
+        The code sees the dataset as ``df``. The result is a dict with ``ok``,
+        ``value``, ``repr``, ``stdout``, ``error``, ``traceback`` and ``duration``.
+        """
+        if self.sandbox is None:
+            raise RuntimeError("The sandbox is disabled (SANDBOX=0).")
+        return self.run_in_sandbox(code, self.sandbox_datasets({"df": df_key}))
 
+    def analyze(self, query: str) -> str:
+        """Answer a question about the datasets; raises if it cannot be answered."""
+        logging.info("Available datasets: %s", ", ".join(self.handler.keys()))
+
+        dataset_keys = self.handler.route(query)
+        logging.info("Routing query to: %s", ", ".join(dataset_keys))
+        if len(dataset_keys) == 1:
+            answer = self.try_plan(query, dataset_keys[0])
+            if answer is not None:
+                return answer
+
+        run_id = uuid.uuid4().hex
+        agent = self.create_agent(dataset_keys, run_id)
         try:
-            dataset_key = input("Please specify the dataset : " ).strip()
-            agent = self.create_agent(dataset_key)
+            # The agent's Python tool already ran the code, so it is not executed again here
             response = agent.invoke({"input": query})
+        finally:
+            self.end_run(run_id)
+        return self._checked_output(response)
 
-            code_snippet = self.extract_code_snippet(response["output"])
-            logging.info(f"Executing Code:\n{code_snippet}")
-                
-            context = {"pd": pd, "df": self.handler.get_data(dataset_key)}
-            self.execute_code(code_snippet, context)
+    async def aanalyze(self, query: str) -> str:
+        """Asynchronous counterpart of ``analyze``; blocking steps run off the event loop."""
+        logging.info("Available datasets: %s", ", ".join(self.handler.keys()))
+
+        dataset_keys = await asyncio.to_thread(self.handler.route, query)
+        logging.info("Routing query to: %s", ", ".join(dataset_keys))
+        if len(dataset_keys) == 1:
+            # Fetching the frame may reload it from disk, and the planner runs pandas on it
+            answer = await asyncio.to_thread(self.try_plan, query, dataset_keys[0])
+            if answer is not None:
+                return answer
+
+        run_id = uuid.uuid4().hex
+        agent = await asyncio.to_thread(self.create_agent, dataset_keys, run_id)
+        try:
+            response = await agent.ainvoke({"input": query})
+        finally:
+            self.end_run(run_id)
+        return self._checked_output(response)
 
-        # except Exception as e:
-        #     logging.error(f"An error occurred: {e}")
-        except:
-            pass
+    def try_plan(self, query: str, df_key: str):
+        """Answer a plain aggregation over one dataset with the query planner, or return None."""
+        return self.planner.try_answer(query, self.handler.get_data(df_key))
+
+    @staticmethod
+    def _checked_output(response: dict) -> str:
+        output = response["output"]
+        if output.startswith(AGENT_STOPPED):
+            raise RuntimeError(output)
+        return output
+
+    def run(self, query: str):
+        """Handle user interactions; as the supervisor's tool, failures are reported as text."""
+        try:
+            return self.analyze(query)
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            return ANALYSIS_ERROR
+
+    async def arun(self, query: str):
+        """Asynchronous counterpart of ``run``."""
+        try:
+            return await self.aanalyze(query)
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            return ANALYSIS_ERROR
 
     # def run(self):
     #     """Handle user interactions."""
-    #     logging.info("Available datasets: %s", ", ".join(self.handler._data.keys()))
+    #     logging.info("Available datasets: %s", ", ".join(self.handler.keys()))
     #     while True:
     #         query = input("Enter your query ('stop' to quit): ").strip()
     #         if query.lower() == "stop":
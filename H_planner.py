@@ -0,0 +1,277 @@
+import re
+import logging
+import pandas as pd
+
+AGGREGATION_WORDS = {
+    "total": "sum", "sum": "sum", "overall": "sum",
+    "average": "mean", "avg": "mean", "mean": "mean",
+    "count": "count", "number": "count", "many": "count",
+    "median": "median",
+    "maximum": "max", "max": "max",
+    "minimum": "min", "min": "min",
+}
+# Ranking words; with a group they rank the groups, without one they pick max/min
+RANKING_WORDS = {
+    "top": "largest", "highest": "largest", "largest": "largest", "most": "largest", "best": "largest",
+    "bottom": "smallest", "lowest": "smallest", "smallest": "smallest", "least": "smallest", "worst": "smallest",
+}
+GROUP_WORDS = {"by", "per", "each", "every", "across"}
+# Words that carry no meaning for an aggregation; anything else unrecognized means "ask the LLM"
+FILLER_WORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "is", "are", "was", "were", "what",
+    "which", "show", "me", "give", "tell", "please", "list", "get", "find", "calculate", "compute",
+    "can", "you", "i", "we", "it", "all", "with", "from", "at", "during", "how", "much", "there",
+    "value", "values", "amount", "group", "grouped", "rows", "records", "entries", "data", "only",
+    "year", "month",
+}
+MAX_GROUP_CARDINALITY = 100
+MAX_TOP_N = 1000
+
+
+def _tokens(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _word_forms(word: str) -> set:
+    """Return a word and the plural spellings a question may use for it."""
+    forms = {word, f"{word}s", f"{word}es"}
+    if word.endswith("y"):
+        forms.add(f"{word[:-1]}ies")
+    return forms
+
+
+class QueryPlan:
+    """A parsed aggregation: ``agg`` of ``measure`` grouped by ``group`` after ``filters``."""
+
+    def __init__(self, agg: str, measure: str = None, group: str = None, filters: list = None,
+                 rank: str = None, top_n: int = None):
+        self.agg = agg
+        self.measure = measure
+        self.group = group
+        self.filters = filters or []
+        self.rank = rank
+        self.top_n = top_n
+
+    def describe(self) -> str:
+        """Return a one-line description of the plan."""
+        text = f"{self.agg} of {self.measure or 'rows'}"
+        if self.group:
+            text += f" by {self.group}"
+        if self.rank:
+            text += f" ({'top' if self.rank == 'largest' else 'bottom'} {self.top_n})"
+        if self.filters:
+            conditions = []
+            for col, (values, _) in self.filter_values().items():
+                if len(values) == 1:
+                    conditions.append(f"{col} = {values[0]}")
+                else:
+                    conditions.append(f"{col} in ({', '.join(map(str, values))})")
+            text += " where " + " and ".join(conditions)
+        return text
+
+    def filter_values(self) -> dict:
+        """Group the filters by column: ``{column: (values, on_year)}``; values of one column are ORed."""
+        grouped = {}
+        for col, value, on_year in self.filters:
+            grouped.setdefault(col, ([], on_year))[0].append(value)
+        return grouped
+
+    def execute(self, df: pd.DataFrame):
+        """Run the plan against ``df`` and return a scalar or a Series."""
+        frame = df
+        for col, (values, on_year) in self.filter_values().items():
+            column = frame[col].dt.year if on_year else frame[col]
+            frame = frame[column.isin(values)]
+
+        if self.group is None:
+            if self.measure is None:
+                return len(frame)
+            return frame[self.measure].agg(self.agg)
+
+        grouped = frame.groupby(self.group, observed=True)
+        if self.measure is None:
+            result = grouped.size()
+        else:
+            result = grouped[self.measure].agg(self.agg)
+        if self.rank == "largest":
+            return result.nlargest(self.top_n)
+        if self.rank == "smallest":
+            return result.nsmallest(self.top_n)
+        return result
+
+    def format_result(self, result) -> str:
+        """Render a plan result as text for the supervisor agent."""
+        if isinstance(result, pd.Series):
+            label = self.measure if self.measure and self.agg != "count" else "count"
+            body = result.rename(label).to_frame().to_string()
+        elif isinstance(result, float):
+            body = f"{result:,.2f}"
+        else:
+            body = str(result)
+        return f"Result ({self.describe()}):\n{body}"
+
+
+class QueryPlanner:
+    """
+    Rule-based parser for plain aggregation questions.
+
+    ``plan`` maps questions such as "total profit by country in 2014" or
+    "top 5 products by units sold" onto the known columns of a DataFrame and
+    returns None for anything it cannot account for word by word, so those
+    questions still go to the LLM agent.
+    """
+
+    def plan(self, query: str, df: pd.DataFrame):
+        """
+        Parse ``query`` against the columns of ``df``.
+
+        :param query: The user's question.
+        :param df: The dataset the question is about.
+        :return: A QueryPlan, or None when the question is not a plain aggregation.
+        """
+        tokens = _tokens(query)
+        used = [False] * len(tokens)
+
+        mentions = self._column_mentions(tokens, used, df)
+        filters = self._value_filters(tokens, used, df)
+
+        agg = rank = None
+        top_n = None
+        for i, token in enumerate(tokens):
+            if used[i]:
+                continue
+            if token in AGGREGATION_WORDS and agg is None:
+                agg = AGGREGATION_WORDS[token]
+                used[i] = True
+            elif token in RANKING_WORDS and rank is None:
+                rank = RANKING_WORDS[token]
+                used[i] = True
+                if i + 1 < len(tokens) and tokens[i + 1].isdigit() and 0 < int(tokens[i + 1]) <= MAX_TOP_N:
+                    top_n = int(tokens[i + 1])
+                    used[i + 1] = True
+            elif token in GROUP_WORDS or token in FILLER_WORDS:
+                used[i] = True
+
+        if not all(used):
+            return None
+
+        # Every "by X" must name a column; "by month" on a frame with only month_number is left to the agent
+        starts = {start for _, start in mentions}
+        for i, token in enumerate(tokens):
+            if token not in GROUP_WORDS:
+                continue
+            if i + 1 not in starts:
+                return None
+
+        group = measure = None
+        for col, start in mentions:
+            preceded_by_group_word = start > 0 and tokens[start - 1] in GROUP_WORDS
+            follows_ranking = start > 0 and (
+                tokens[start - 1] in RANKING_WORDS
+                or (start > 1 and tokens[start - 1].isdigit() and tokens[start - 2] in RANKING_WORDS)
+            )
+            if group is None and (preceded_by_group_word or follows_ranking) and self._groupable(df[col]):
+                group = col
+            elif measure is None and pd.api.types.is_numeric_dtype(df[col]):
+                measure = col
+            else:
+                return None
+
+        if measure is None and agg not in (None, "count"):
+            return None
+        if agg is None:
+            if rank is None:
+                return None
+            if group is None:
+                # "highest profit" without a group asks for the single largest value
+                agg = "max" if rank == "largest" else "min"
+                rank = None
+            else:
+                agg = "sum" if measure else "count"
+        if rank and group is None:
+            return None
+        if rank and top_n is None:
+            top_n = 1
+        if agg == "count" and measure is not None:
+            # "how many units sold" asks for the total of a measure, not a row count
+            agg = "sum"
+
+        return QueryPlan(agg, measure, group, filters, rank, top_n)
+
+    def try_answer(self, query: str, df: pd.DataFrame):
+        """Answer ``query`` locally when it parses; return None to fall back to the LLM agent."""
+        plan = self.plan(query, df)
+        if plan is None:
+            return None
+        try:
+            result = plan.execute(df)
+        except Exception as e:
+            logging.warning(f"Query plan '{plan.describe()}' failed, falling back to the agent: {e}")
+            return None
+        logging.info(f"Answered locally: {plan.describe()}")
+        return plan.format_result(result)
+
+    @staticmethod
+    def _groupable(series: pd.Series) -> bool:
+        return series.nunique(dropna=True) <= MAX_GROUP_CARDINALITY
+
+    @staticmethod
+    def _column_mentions(tokens: list, used: list, df: pd.DataFrame) -> list:
+        """Find column names in the question, longest names first, marking their tokens used."""
+        columns = sorted(df.columns, key=lambda c: -len(str(c).split("_")))
+        mentions = []
+        for col in columns:
+            words = [w for w in str(col).lower().split("_") if w]
+            if not words:
+                continue
+            for start in range(len(tokens) - len(words) + 1):
+                span = range(start, start + len(words))
+                if any(used[i] for i in span):
+                    continue
+                head_match = all(tokens[start + k] == w for k, w in enumerate(words[:-1]))
+                if head_match and tokens[start + len(words) - 1] in _word_forms(words[-1]):
+                    for i in span:
+                        used[i] = True
+                    mentions.append((col, start))
+                    break
+        return sorted(mentions, key=lambda mention: mention[1])
+
+    @staticmethod
+    def _value_filters(tokens: list, used: list, df: pd.DataFrame) -> list:
+        """Find years and categorical values in the question and turn them into equality filters."""
+        filters = []
+        year_columns = [c for c in df.columns if "year" in str(c).lower() and pd.api.types.is_integer_dtype(df[c])]
+        date_columns = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+        for i, token in enumerate(tokens):
+            if used[i] or not (len(token) == 4 and token.isdigit() and 1900 <= int(token) <= 2100):
+                continue
+            if i > 0 and tokens[i - 1] in RANKING_WORDS:
+                continue
+            if year_columns:
+                filters.append((year_columns[0], int(token), False))
+            elif date_columns:
+                filters.append((date_columns[0], int(token), True))
+            else:
+                continue
+            used[i] = True
+
+        for col in df.columns:
+            series = df[col]
+            if not (isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == "object"):
+                continue
+            values = series.cat.categories if isinstance(series.dtype, pd.CategoricalDtype) else series.dropna().unique()
+            if len(values) > MAX_GROUP_CARDINALITY:
+                continue
+            for value in sorted((v for v in values if isinstance(v, str)), key=lambda v: -len(v)):
+                words = _tokens(value)
+                if not words:
+                    continue
+                for start in range(len(tokens) - len(words) + 1):
+                    span = range(start, start + len(words))
+                    if any(used[i] for i in span) or tokens[start:start + len(words)] != words:
+                        continue
+                    for i in span:
+                        used[i] = True
+                    filters.append((col, value, False))
+                    break
+        return filters
@@ -0,0 +1,104 @@
+import pandas as pd
+
+TOP_VALUES = 5
+# Rough characters-per-token ratio used to keep the rendered profile within its budget
+CHARS_PER_TOKEN = 4
+
+
+def _scalar(value):
+    """Convert numpy/pandas scalars into JSON-friendly Python values."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def column_fingerprint(series: pd.Series) -> str:
+    """Cheaply identify a column's contents so unchanged columns are not re-profiled."""
+    hashed = pd.util.hash_pandas_object(series, index=False)
+    return f"{series.dtype}:{len(series)}:{int(hashed.sum()) & 0xFFFFFFFFFFFFFFFF:x}"
+
+
+def profile_column(series: pd.Series) -> dict:
+    """
+    Summarize one column.
+
+    :return: dtype and null count, plus min/max for numeric and date columns or
+             cardinality and the most frequent values for everything else.
+    """
+    entry = {"dtype": str(series.dtype), "nulls": int(series.isna().sum())}
+    if pd.api.types.is_bool_dtype(series):
+        entry["top"] = {str(k): int(v) for k, v in series.value_counts().head(TOP_VALUES).items()}
+    elif pd.api.types.is_numeric_dtype(series):
+        entry["min"] = _scalar(series.min())
+        entry["max"] = _scalar(series.max())
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        entry["min"] = _scalar(series.min())
+        entry["max"] = _scalar(series.max())
+    else:
+        counts = series.value_counts()
+        entry["unique"] = int(len(counts))
+        entry["top"] = {str(k): int(v) for k, v in counts.head(TOP_VALUES).items()}
+    return entry
+
+
+def profile_frame(df: pd.DataFrame, previous: dict = None) -> dict:
+    """
+    Profile every column of ``df``, reusing entries of ``previous`` for unchanged columns.
+
+    :param df: The dataset to profile.
+    :param previous: An earlier profile of the same dataset, if any.
+    :return: ``{"rows": n, "columns": {name: entry}}`` where each entry carries a fingerprint.
+    """
+    old_columns = (previous or {}).get("columns", {})
+    columns = {}
+    for col in df.columns:
+        fingerprint = column_fingerprint(df[col])
+        old = old_columns.get(str(col))
+        if old is not None and old.get("fingerprint") == fingerprint:
+            columns[str(col)] = old
+            continue
+        entry = profile_column(df[col])
+        entry["fingerprint"] = fingerprint
+        columns[str(col)] = entry
+    return {"rows": int(len(df)), "columns": columns}
+
+
+def _describe(name: str, entry: dict, detailed: bool) -> str:
+    text = f"- {name} ({entry['dtype']}"
+    if entry.get("nulls"):
+        text += f", {entry['nulls']} nulls"
+    text += ")"
+    if not detailed:
+        return text
+    if "min" in entry:
+        text += f": {entry['min']} to {entry['max']}"
+    elif "top" in entry:
+        values = ", ".join(f"{value} ({count})" for value, count in entry["top"].items())
+        unique = entry.get("unique")
+        text += f": {unique} distinct; top {values}" if unique is not None else f": {values}"
+    return text
+
+
+def render_profile(profile: dict, max_tokens: int = 600) -> str:
+    """
+    Render a profile as prompt text, dropping per-column details once ``max_tokens`` is reached.
+
+    Every column is always listed with its dtype; details are added column by
+    column while they fit.
+    """
+    budget = max_tokens * CHARS_PER_TOKEN
+    header = f"The DataFrame has {profile['rows']} rows. Columns:"
+    lines = [_describe(name, entry, detailed=False) for name, entry in profile["columns"].items()]
+    used = len(header) + sum(len(line) + 1 for line in lines)
+    for i, (name, entry) in enumerate(profile["columns"].items()):
+        detailed = _describe(name, entry, detailed=True)
+        extra = len(detailed) - len(lines[i])
+        if used + extra > budget:
+            continue
+        lines[i] = detailed
+        used += extra
+    return "\n".join([header] + lines)
@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import logging
+import threading
+import warnings
+from langchain_core.load import dumpd, load
+from langchain_core.prompts import PromptTemplate
+
+PROMPT_CACHE_DIR = os.getenv("PROMPT_CACHE_DIR", ".prompt_cache")
+
+# Prompts shipped with the app, so agents can be built without the LangChain hub
+REACT_CHAT_TEMPLATE = """Assistant is a large language model trained by OpenAI.
+
+Assistant is designed to be able to assist with a wide range of tasks, from answering simple questions to providing in-depth explanations and discussions on a wide range of topics. As a language model, Assistant is able to generate human-like text based on the input it receives, allowing it to engage in natural-sounding conversations and provide responses that are coherent and relevant to the topic at hand.
+
+Assistant is constantly learning and improving, and its capabilities are constantly evolving. It is able to process and understand large amounts of text, and can use this knowledge to provide accurate and informative responses to a wide range of questions. Additionally, Assistant is able to generate its own text based on the input it receives, allowing it to engage in discussions and provide explanations and descriptions on a wide range of topics.
+
+Overall, Assistant is a powerful tool that can help with a wide range of tasks and provide valuable insights and information on a wide range of topics. Whether you need help with a specific question or just want to have a conversation about a particular topic, Assistant is here to assist.
+
+TOOLS:
+------
+
+Assistant has access to the following tools:
+
+{tools}
+
+To use a tool, please use the following format:
+
+```
+Thought: Do I need to use a tool? Yes
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+```
+
+When you have a response to say to the Human, or if you do not need to use a tool, you MUST use the format:
+
+```
+Thought: Do I need to use a tool? No
+Final Answer: [your response here]
+```
+
+Begin!
+
+Previous conversation history:
+{chat_history}
+
+New input: {input}
+{agent_scratchpad}"""
+BUNDLED_PROMPTS = {
+    "hwchase17/react-chat": REACT_CHAT_TEMPLATE,
+}
+
+
+class PromptRegistry:
+    """
+    Prompts by hub name (``owner/name`` or ``owner/name:commit``), loaded once per process.
+
+    A prompt comes from the on-disk cache if it has been fetched before, then
+    from the prompts bundled with the app, and only then from the LangChain
+    hub, whose answer is cached to disk so the next process starts offline.
+    """
+
+    def __init__(self, cache_dir: str = None):
+        """
+        :param cache_dir: Where fetched prompts are stored (``PROMPT_CACHE_DIR``, default ``.prompt_cache``).
+        """
+        self.cache_dir = cache_dir or PROMPT_CACHE_DIR
+        self._prompts = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str):
+        """
+        Return the prompt for ``name``.
+
+        :param name: The hub name, optionally pinned to a commit.
+        :return: The prompt template.
+        """
+        with self._lock:
+            prompt = self._prompts.get(name)
+            if prompt is None:
+                prompt = self._read_cache(name)
+                if prompt is None and name in BUNDLED_PROMPTS:
+                    prompt = PromptTemplate.from_template(BUNDLED_PROMPTS[name])
+                if prompt is None:
+                    prompt = self._pull(name)
+                self._prompts[name] = prompt
+            return prompt
+
+    def refresh(self, name: str):
+        """Fetch ``name`` from the hub again, replacing the cached and in-memory copies."""
+        prompt = self._pull(name)
+        with self._lock:
+            self._prompts[name] = prompt
+        return prompt
+
+    def cache_path(self, name: str) -> str:
+        """Return the cache file for a prompt name."""
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", name) + ".json")
+
+    def _pull(self, name: str):
+        from langchain import hub
+
+        logging.info(f"Fetching prompt {name} from the LangChain hub.")
+        prompt = hub.pull(name)
+        self._write_cache(name, prompt)
+        return prompt
+
+    def _read_cache(self, name: str):
+        path = self.cache_path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                return load(data)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable prompt cache {path}: {e}")
+            return None
+
+    def _write_cache(self, name: str, prompt) -> None:
+        path = self.cache_path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(dumpd(prompt), f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not cache prompt {name}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Return the process-wide PromptRegistry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
+
+
+if __name__ == "__main__":
+    # Refresh cached prompts from the hub: python H_prompts.py [name ...]
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    for prompt_name in sys.argv[1:] or list(BUNDLED_PROMPTS):
+        get_prompt_registry().refresh(prompt_name)
+        print(f"Cached {prompt_name} in {get_prompt_registry().cache_path(prompt_name)}")
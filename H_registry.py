@@ -0,0 +1,169 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import pandas as pd
+
+
+class DatasetRegistry:
+    """
+    Process-wide store of loaded DataFrames, shared across sessions by file digest.
+
+    Each session maps its own dataset keys to file digests, so two sessions that
+    load the same bytes share one frame. Resident frames are accounted with
+    ``memory_usage(deep=True)``; when the total exceeds the memory budget the
+    least recently used frames are dropped and reloaded on their next access.
+    Reloads run outside the registry lock, one per digest at a time.
+    """
+
+    def __init__(self, memory_budget_mb: float = None):
+        """
+        Initialize the registry.
+
+        :param memory_budget_mb: RAM budget for resident frames in megabytes
+                                 (defaults to ``DATASET_MEMORY_BUDGET_MB`` or 1024).
+        """
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.getenv("DATASET_MEMORY_BUDGET_MB", 1024))
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._frames = OrderedDict()
+        self._loaders = {}
+        self._sessions = {}
+        # Digests being (re)loaded; other callers wait on the Future instead of loading again
+        self._loading = {}
+        self._lock = threading.RLock()
+
+    def is_resident(self, digest: str) -> bool:
+        """Return True when the frame for ``digest`` is currently held in memory."""
+        with self._lock:
+            return digest in self._frames
+
+    def register(self, session_id: str, key: str, digest: str, loader, df: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Bind ``key`` in ``session_id`` to the dataset with content ``digest``.
+
+        :param session_id: The session the key belongs to.
+        :param key: The dataset key used by that session.
+        :param digest: The content digest of the dataset file.
+        :param loader: A callable returning the frame, used whenever it is not resident.
+        :param df: The frame, if the caller already has it.
+        :return: The shared frame for ``digest``.
+        """
+        with self._lock:
+            self._sessions.setdefault(session_id, {})[key] = digest
+            self._loaders[digest] = loader
+            if digest in self._frames:
+                self._frames.move_to_end(digest)
+                return self._frames[digest]["frame"]
+            if df is not None:
+                self._store(digest, df)
+                return df
+        return self._load(digest, key)
+
+    def get(self, session_id: str, key: str) -> pd.DataFrame:
+        """Return the frame bound to ``key`` in ``session_id``, reloading it if it was evicted."""
+        with self._lock:
+            digest = self.digest(session_id, key)
+            entry = self._frames.get(digest)
+            if entry is not None:
+                self._frames.move_to_end(digest)
+                return entry["frame"]
+        return self._load(digest, key)
+
+    def _load(self, digest: str, key: str) -> pd.DataFrame:
+        """Run the loader of a non-resident digest without holding the lock; concurrent callers share it."""
+        with self._lock:
+            entry = self._frames.get(digest)
+            if entry is not None:
+                self._frames.move_to_end(digest)
+                return entry["frame"]
+            loading = self._loading.get(digest)
+            if loading is None:
+                loading = self._loading[digest] = Future()
+                loader = self._loaders[digest]
+            else:
+                loader = None
+        if loader is None:
+            return loading.result()
+
+        logging.info(f"Loading dataset {key} ({digest[:12]}).")
+        try:
+            df = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[digest]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            self._store(digest, df)
+            del self._loading[digest]
+        loading.set_result(df)
+        return df
+
+    def digest(self, session_id: str, key: str) -> str:
+        """Return the content digest bound to ``key`` in ``session_id``."""
+        with self._lock:
+            try:
+                return self._sessions[session_id][key]
+            except KeyError:
+                raise ValueError(f"Data for key '{key}' not loaded.") from None
+
+    def keys(self, session_id: str) -> list:
+        """Return the dataset keys bound in ``session_id``."""
+        with self._lock:
+            return list(self._sessions.get(session_id, {}))
+
+    def release_session(self, session_id: str) -> None:
+        """Forget a session's bindings; frames no other session uses go first on eviction."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            referenced = self._referenced()
+            for digest in list(self._loaders):
+                if digest not in referenced and digest not in self._frames:
+                    del self._loaders[digest]
+
+    def memory_usage(self) -> int:
+        """Return the bytes held by resident frames."""
+        with self._lock:
+            return sum(entry["nbytes"] for entry in self._frames.values())
+
+    def _store(self, digest: str, df: pd.DataFrame) -> None:
+        self._frames[digest] = {"frame": df, "nbytes": int(df.memory_usage(deep=True).sum())}
+        self._evict(keep=digest)
+
+    def _referenced(self) -> set:
+        return {digest for keys in self._sessions.values() for digest in keys.values()}
+
+    def _evict(self, keep: str) -> None:
+        used = self.memory_usage()
+        if used <= self.memory_budget:
+            return
+        referenced = self._referenced()
+        # Unreferenced frames go first, then everything else in LRU order
+        candidates = [d for d in self._frames if d not in referenced]
+        candidates += [d for d in self._frames if d in referenced]
+        for digest in candidates:
+            if used <= self.memory_budget:
+                break
+            if digest == keep:
+                continue
+            used -= self._frames.pop(digest)["nbytes"]
+            if digest not in referenced:
+                self._loaders.pop(digest, None)
+            logging.info(f"Evicted dataset {digest[:12]} to stay within the memory budget.")
+        if used > self.memory_budget:
+            logging.warning("Dataset memory budget exceeded by a single dataset.")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> DatasetRegistry:
+    """Return the process-wide DatasetRegistry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DatasetRegistry()
+        return _registry
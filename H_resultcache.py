@@ -0,0 +1,199 @@
+import os
+import ast
+import sys
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import pandas as pd
+from H_sandbox import _sanitize
+
+try:
+    import pyarrow as pa
+except ImportError:  # results are kept as pandas objects instead
+    pa = None
+
+# Calls whose result changes between runs (or that have side effects), so snippets using them are not cached
+IMPURE_CALLS = {
+    "sample", "random", "rand", "randn", "randint", "shuffle", "choice", "now", "today", "time", "utcnow",
+    "show", "savefig", "open", "to_csv", "to_excel", "to_parquet", "to_json", "to_pickle", "input", "exec", "eval",
+}
+
+
+def code_key(code: str):
+    """
+    Return a hash of the snippet's AST, or None if the snippet is not worth caching.
+
+    Comments, blank lines, spacing and quote style do not change the hash. Snippets
+    that do not parse or that call anything in ``IMPURE_CALLS`` return None.
+    """
+    try:
+        tree = ast.parse(_sanitize(code))
+    except SyntaxError:
+        return None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+            if name in IMPURE_CALLS:
+                return None
+        elif isinstance(node, (ast.Import, ast.ImportFrom)) and any(
+            alias.name.split(".")[0] in ("random", "time", "datetime") for alias in node.names
+        ):
+            return None
+    return hashlib.sha256(ast.dump(tree, annotate_fields=False).encode("utf-8")).hexdigest()
+
+
+def binds_names(code: str) -> bool:
+    """
+    Return True if a snippet changes its run's namespace (assigns, imports, defines or
+    modifies in place), so its result and later ones depend on more than the data.
+    """
+    try:
+        tree = ast.parse(_sanitize(code))
+    except SyntaxError:
+        return False
+    if any(not isinstance(statement, ast.Expr) for statement in tree.body):
+        return True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.NamedExpr):
+            return True
+        if isinstance(node, ast.Call) and any(keyword.arg == "inplace" for keyword in node.keywords):
+            return True
+    return False
+
+
+def _pack(value):
+    """Convert a result value to its stored form and size; frames become Arrow tables."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        if pa is not None:
+            frame = value.to_frame() if isinstance(value, pd.Series) else value
+            try:
+                table = pa.Table.from_pandas(frame)
+                return ("series" if isinstance(value, pd.Series) else "frame", table), table.nbytes
+            except (pa.ArrowException, TypeError, ValueError):
+                pass
+        size = value.memory_usage(deep=True)
+        return ("pandas", value.copy()), int(size.sum() if hasattr(size, "sum") else size)
+    return ("value", value), sys.getsizeof(value)
+
+
+def _unpack(packed):
+    kind, stored = packed
+    if kind == "frame":
+        return stored.to_pandas()
+    if kind == "series":
+        return stored.to_pandas().iloc[:, 0]
+    if kind == "pandas":
+        return stored.copy()
+    return stored
+
+
+class ResultCache:
+    """
+    A memory-bounded LRU of sandbox results keyed by code AST hash and dataset versions.
+
+    Datasets are identified by the content digest of their source file, so a
+    changed file never matches an old entry; entries of a replaced dataset are
+    also dropped as soon as ``DataHandler`` reloads it. DataFrame and Series
+    results are held as Arrow tables and rebuilt on every hit, so callers can
+    never modify a cached result.
+    """
+
+    def __init__(self, max_mb: float = None):
+        """
+        :param max_mb: Memory budget (``RESULT_CACHE_MB``, default 256).
+        """
+        max_mb = max_mb if max_mb is not None else float(os.getenv("RESULT_CACHE_MB", 256))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(code: str, datasets: dict):
+        """Build the key for a snippet run against ``{name: {"version": digest, ...}}``; None if uncacheable."""
+        code_hash = code_key(code)
+        if code_hash is None:
+            return None
+        versions = tuple(sorted((name, spec["version"]) for name, spec in datasets.items()))
+        return code_hash, versions
+
+    def get(self, key):
+        """Return a copy of the cached result for ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        result, packed, _ = entry
+        return {**result, "value": _unpack(packed), "cached": True}
+
+    def put(self, key, result: dict) -> None:
+        """Store a successful sandbox result, evicting the least recently used entries past the budget."""
+        if not result.get("ok"):
+            return
+        packed, size = _pack(result.get("value"))
+        text = {k: v for k, v in result.items() if k != "value"}
+        size += sum(len(v) for v in text.values() if isinstance(v, str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (text, packed, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def invalidate(self, version: str) -> int:
+        """Drop every entry computed on the dataset with content digest ``version``."""
+        with self._lock:
+            stale = [key for key in self._entries if any(v == version for _, v in key[1])]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[2]
+        if stale:
+            logging.info(f"Dropped {len(stale)} cached results of dataset {version[:12]}.")
+        return len(stale)
+
+    def execute(self, sandbox, code: str, datasets: dict, run_id: str = None) -> dict:
+        """
+        Run ``code`` in ``sandbox`` unless an identical snippet already ran on the same data.
+
+        Callers must only pass snippets whose run namespace holds nothing but the datasets
+        (see ``binds_names``); ``run_id`` is passed through to the sandbox.
+        """
+        key = self.make_key(code, datasets)
+        if key is not None:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+        result = sandbox.execute(code, datasets, run_id=run_id)
+        if key is not None:
+            self.put(key, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide ResultCache, or None when ``RESULT_CACHE`` is set to 0."""
+    global _cache
+    if os.getenv("RESULT_CACHE", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
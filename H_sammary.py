@@ -1,17 +1,17 @@
 import os
-import pandas as pd
 import logging
-from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from langchain.agents.agent_types import AgentType
+from H_llmclient import chat_model
+
+# What ``summarize`` tells the supervisor when the summary could not be generated
+SUMMARY_ERROR = "An error occurred while generating the summary."
 
 
 class SummaryAgent:
     """A class to summarize the outputs of the PandasAgent."""
 
-    def __init__(self, temperature: float, base_url: str, model_name: str):
-        self.llm = self.initialize_llm(temperature, base_url, model_name)
+    def __init__(self, temperature: float, base_url: str, model_name: str, llm=None):
+        self.llm = llm if llm is not None else self.initialize_llm(temperature, base_url, model_name)
 
     @staticmethod
     def initialize_llm(temperature: float, base_url: str, model_name: str) -> ChatOpenAI:
@@ -19,19 +19,38 @@ class SummaryAgent:
         api_key = os.getenv("PLOT_API_KEY")
         if not api_key:
             raise ValueError("API key is missing. Ensure 'API_KEY' is set in your environment.")
-        return ChatOpenAI(
+        return chat_model(
             base_url=base_url,
             model=model_name,
             api_key=api_key,
             temperature=temperature,
         )
 
+    @staticmethod
+    def build_prompt(text: str) -> str:
+        """Build the summarization prompt for the given text."""
+        return f"Summarize the following content in a concise and clear manner:\n\n{text}"
+
+    def generate(self, text: str) -> str:
+        """Generate a summary of the given text; raises if the LLM call fails."""
+        return self.llm.invoke(self.build_prompt(text)).content
+
+    async def agenerate(self, text: str) -> str:
+        """Asynchronous counterpart of ``generate``."""
+        return (await self.llm.ainvoke(self.build_prompt(text))).content
+
     def summarize(self, text: str) -> str:
-        """Generate a summary of the given text."""
-        prompt = f"Summarize the following content in a concise and clear manner:\n\n{text}"
+        """Generate a summary of the given text; as the supervisor's tool, failures are reported as text."""
+        try:
+            return self.generate(text)
+        except Exception as e:
+            logging.error(f"Error during summarization: {e}")
+            return SUMMARY_ERROR
+
+    async def asummarize(self, text: str) -> str:
+        """Generate a summary of the given text without blocking the event loop."""
         try:
-            response = self.llm.invoke({"input": prompt})
-            return response["output"]
+            return await self.agenerate(text)
         except Exception as e:
             logging.error(f"Error during summarization: {e}")
-            return "An error occurred while generating the summary."
+            return SUMMARY_ERROR
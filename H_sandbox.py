@@ -0,0 +1,312 @@
+import os
+import io
+import re
+import ast
+import time
+import logging
+import threading
+import traceback
+import contextlib
+import multiprocessing
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # not available on Windows; limits fall back to the wall-clock timeout
+    resource = None
+
+# Results with at most this many rows are sent back as objects, larger ones only as text
+MAX_RESULT_ROWS = 10000
+MAX_REPR_CHARS = 4000
+# Datasets a worker keeps loaded before dropping the least recently used one
+MAX_WORKER_DATASETS = 8
+# Agent runs whose variables a worker keeps; older ones are dropped if a run never ends
+MAX_WORKER_RUNS = 32
+
+
+def _sanitize(code: str) -> str:
+    """Strip markdown fences and a leading ``python`` tag, as LangChain's REPL tool does."""
+    code = re.sub(r"^(\s|`)*(?i:python)?\s*", "", code)
+    return re.sub(r"(\s|`)*$", "", code)
+
+
+def _run_snippet(code: str, context: dict):
+    """Execute ``code`` and return the value of its last expression, if it ends with one."""
+    tree = ast.parse(_sanitize(code))
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        body, last = tree.body[:-1], tree.body[-1]
+    else:
+        body, last = tree.body, None
+    exec(compile(ast.Module(body=body, type_ignores=[]), "<sandbox>", "exec"), context)
+    if last is None:
+        return None
+    return eval(compile(ast.Expression(body=last.value), "<sandbox>", "eval"), context)
+
+
+def _portable(value):
+    """Return ``value`` if it is cheap and safe to send back to the parent, else None."""
+    import pandas as pd
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value if len(value) <= MAX_RESULT_ROWS else None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)) and all(isinstance(v, (bool, int, float, str)) for v in value):
+        return value
+    if hasattr(value, "item") and getattr(value, "ndim", 1) == 0:
+        return value.item()
+    return None
+
+
+def _worker_main(conn, memory_mb: int) -> None:
+    """Serve snippet requests from the parent until it sends None."""
+    import pandas as pd
+
+    try:
+        import pyarrow.feather as feather
+    except ImportError:
+        feather = None
+
+    # Generated code gets shallow copies; copy-on-write keeps the cached frames intact
+    pd.set_option("mode.copy_on_write", True)
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    frames = OrderedDict()
+    namespaces = OrderedDict()
+    while True:
+        request = conn.recv()
+        if request is None:
+            return
+
+        for run_id in request.get("ended", ()):
+            namespaces.pop(run_id, None)
+        # Frames the worker has not cached and cannot memory-map are asked for before anything runs
+        missing = [
+            name for name, spec in request["datasets"].items()
+            if spec["version"] not in frames and spec.get("frame") is None
+            and not (spec.get("path") and os.path.exists(spec["path"]))
+        ]
+        if missing:
+            conn.send({"missing": missing})
+            continue
+
+        if resource is not None and request["cpu_seconds"]:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = int(usage.ru_utime + usage.ru_stime + request["cpu_seconds"]) + 1
+            hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+        started = time.perf_counter()
+        stdout = io.StringIO()
+        response = {"ok": True, "value": None, "repr": "", "error": None, "traceback": None}
+        try:
+            # Snippets of one agent run share their variables, like the in-process REPL tool
+            run_id = request.get("run_id")
+            context = namespaces.get(run_id)
+            if context is None:
+                context = {"pd": pd}
+                if run_id is not None:
+                    namespaces[run_id] = context
+                    while len(namespaces) > MAX_WORKER_RUNS:
+                        namespaces.popitem(last=False)
+            elif run_id is not None:
+                namespaces.move_to_end(run_id)
+            for name, spec in request["datasets"].items():
+                version = spec["version"]
+                if version not in frames:
+                    if spec.get("frame") is not None:
+                        frames[version] = spec["frame"]
+                    else:
+                        table = feather.read_table(spec["path"], memory_map=True)
+                        frames[version] = table.to_pandas(split_blocks=True)
+                    while len(frames) > MAX_WORKER_DATASETS:
+                        frames.popitem(last=False)
+                frames.move_to_end(version)
+                if name not in context:
+                    context[name] = frames[version].copy(deep=False)
+
+            with contextlib.redirect_stdout(stdout):
+                value = _run_snippet(request["code"], context)
+            response["value"] = _portable(value)
+            response["repr"] = "" if value is None else str(value)[:MAX_REPR_CHARS]
+        except BaseException as e:
+            response.update(ok=False, error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+        response["stdout"] = stdout.getvalue()[:MAX_REPR_CHARS]
+        response["duration"] = time.perf_counter() - started
+        try:
+            conn.send(response)
+        except Exception:
+            response["value"] = None
+            conn.send(response)
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # Runs with variables in this worker, and ended runs to drop with the next request
+        self.runs = set()
+        self.ended = []
+
+    def stop(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    A pool of pre-started worker processes that run generated pandas code.
+
+    Workers keep the datasets they have seen (memory-mapped from the columnar
+    cache when possible) and run each snippet under a CPU-time limit, an address
+    space limit and a wall-clock timeout. A worker that hits a limit is killed and
+    replaced, so a runaway snippet never blocks the server process.
+
+    Snippets sent with the same ``run_id`` go to the same worker and share one
+    namespace, so a later step can use the variables of an earlier one;
+    ``end_run`` frees it.
+    """
+
+    def __init__(self, workers: int = None, timeout: float = None, memory_mb: int = None):
+        """
+        Start the workers.
+
+        :param workers: Number of worker processes (``SANDBOX_WORKERS``, default 2).
+        :param timeout: Wall-clock and CPU seconds per snippet (``SANDBOX_TIMEOUT``, default 30).
+        :param memory_mb: Address space limit per worker (``SANDBOX_MEMORY_MB``, default 4096; 0 disables).
+        """
+        self.size = workers if workers is not None else int(os.getenv("SANDBOX_WORKERS", 2))
+        self.timeout = timeout if timeout is not None else float(os.getenv("SANDBOX_TIMEOUT", 30))
+        self.memory_mb = memory_mb if memory_mb is not None else int(os.getenv("SANDBOX_MEMORY_MB", 4096))
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            self._ctx.set_forkserver_preload(["pandas", "H_sandbox"])
+        self._idle = [_Worker(self._ctx, self.memory_mb) for _ in range(self.size)]
+        self._runs = {}
+        self._cond = threading.Condition()
+
+    def _acquire(self, run_id):
+        """Take the worker holding ``run_id``'s namespace (waiting for it if busy), or the least used idle one."""
+        with self._cond:
+            while True:
+                worker = self._runs.get(run_id) if run_id is not None else None
+                if worker is not None and worker in self._idle:
+                    break
+                if worker is None and self._idle:
+                    worker = min(self._idle, key=lambda w: len(w.runs))
+                    break
+                self._cond.wait()
+            self._idle.remove(worker)
+            if run_id is not None:
+                self._runs[run_id] = worker
+                worker.runs.add(run_id)
+            ended, worker.ended = worker.ended, []
+            return worker, ended
+
+    def _release(self, worker) -> None:
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify_all()
+
+    def end_run(self, run_id) -> None:
+        """Free the namespace of an agent run; the worker drops it with its next request."""
+        with self._cond:
+            worker = self._runs.pop(run_id, None)
+            if worker is not None:
+                worker.runs.discard(run_id)
+                worker.ended.append(run_id)
+
+    def execute(self, code: str, datasets: dict, timeout: float = None, run_id: str = None) -> dict:
+        """
+        Run a snippet in a worker.
+
+        :param code: The Python code; the value of its last expression is returned.
+        :param datasets: Maps variable names to ``{"version": digest, "path": feather_path,
+                         "frame": callable}``. ``frame`` is only called (and the frame
+                         pickled) when the worker has not cached that version and cannot
+                         memory-map ``path``.
+        :param timeout: Overrides the pool's per-snippet limit.
+        :param run_id: Shares variables with earlier snippets of the same run; None runs the
+                       snippet in a fresh namespace.
+        :return: ``{"ok", "value", "repr", "stdout", "error", "traceback", "duration"}``.
+        """
+        timeout = timeout or self.timeout
+        worker, ended = self._acquire(run_id)
+        request = {
+            "code": code,
+            "datasets": {name: {"version": spec["version"], "path": spec.get("path")} for name, spec in datasets.items()},
+            "cpu_seconds": int(timeout),
+            "run_id": run_id,
+            "ended": ended,
+        }
+        try:
+            while True:
+                worker.conn.send(request)
+                if not worker.conn.poll(timeout):
+                    error = f"TimeoutError: execution exceeded {timeout:.0f} seconds"
+                    break
+                response = worker.conn.recv()
+                if "missing" not in response:
+                    self._release(worker)
+                    return response
+                request["ended"] = []
+                for name in response["missing"]:
+                    request["datasets"][name]["frame"] = datasets[name]["frame"]()
+        except (EOFError, OSError):
+            error = "WorkerError: the sandbox worker stopped (CPU or memory limit exceeded)"
+        except Exception:
+            self._release(worker)
+            raise
+
+        logging.warning(f"Sandbox worker replaced: {error}")
+        worker.stop()
+        with self._cond:
+            # The variables of the runs this worker held are gone with it
+            for lost in worker.runs:
+                self._runs.pop(lost, None)
+        self._release(_Worker(self._ctx, self.memory_mb))
+        return {
+            "ok": False, "value": None, "repr": "", "stdout": "",
+            "error": error, "traceback": None, "duration": timeout,
+        }
+
+    def close(self) -> None:
+        """Stop every idle worker."""
+        with self._cond:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.stop()
+
+
+def format_result(result: dict) -> str:
+    """Render a sandbox result as an agent observation."""
+    if not result["ok"]:
+        return result["error"]
+    parts = [part for part in (result["stdout"].rstrip(), result["repr"]) if part]
+    return "\n".join(parts)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox():
+    """Return the process-wide SandboxPool, or None when ``SANDBOX`` is set to 0."""
+    global _pool
+    if os.getenv("SANDBOX", "1") == "0":
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+        return _pool
@@ -0,0 +1,184 @@
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+
+# Share of non-null values that must parse for a column to be converted
+PARSE_THRESHOLD = 0.95
+# Strings with at most this many distinct values (and mostly repeated) become categoricals
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MAX_RATIO = 0.5
+
+CURRENCY_CHARS = r"$€¥£฿"
+_NEGATIVE_PARENS = rf"^[{CURRENCY_CHARS}]?\s*\(.*\)$"
+_NUMBER_NOISE = rf"[\s{CURRENCY_CHARS},()]"
+_DATE_SHAPE = r"^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}(?:[ T]\d{1,2}:\d{2}(?::\d{2})?)?$"
+_ACCOUNTING_ZEROS = ["-", "–", "—"]
+
+
+def _parse_numbers(text: pd.Series) -> pd.Series:
+    """
+    Parse stripped strings such as ``1,618.50``, ``$(1,234)`` or an accounting ``-``.
+
+    Values that are not numbers come back as NaN.
+    """
+    negative = text.str.contains(_NEGATIVE_PARENS, regex=True)
+    cleaned = text.str.replace(_NUMBER_NOISE, "", regex=True)
+    cleaned = cleaned.mask(cleaned.isin(_ACCOUNTING_ZEROS), "0")
+    numbers = pd.to_numeric(cleaned, errors="coerce")
+    return numbers.mask(negative.fillna(False).astype(bool), -numbers)
+
+
+def _parse_dates(text: pd.Series, fmt: str = None) -> pd.Series:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return pd.to_datetime(text, format=fmt, errors="coerce")
+
+
+def _date_formats(text: pd.Series) -> list:
+    """
+    Return the formats that parse ``text``, month-first before day-first.
+
+    More than one format means the values are ambiguous (e.g. every day is <= 12).
+    """
+    try:
+        from pandas.tseries.api import guess_datetime_format
+    except ImportError:
+        return [None]
+    sample = text.iloc[0]
+    candidates = []
+    for dayfirst in (False, True):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            fmt = guess_datetime_format(sample, dayfirst=dayfirst)
+        if fmt and fmt not in candidates:
+            candidates.append(fmt)
+    formats = [fmt for fmt in candidates if _parse_dates(text, fmt).notna().mean() >= PARSE_THRESHOLD]
+    return formats or [None]
+
+
+def _resolve_date_format(df: pd.DataFrame, col: str, formats: list):
+    """
+    Pick between ambiguous date formats using a month-number column when the frame has one.
+
+    A format is only chosen when it agrees with the month column on every row and no
+    other format does; otherwise the first (month-first, as pandas assumes) is kept.
+    """
+    text = df[col].dropna().astype(str).str.strip()
+    for other in df.columns:
+        if other == col or "month" not in str(other).lower():
+            continue
+        months = pd.to_numeric(df.loc[text.index, other], errors="coerce")
+        if not months.between(1, 12).all():
+            continue
+        matching = [fmt for fmt in formats if (_parse_dates(text, fmt).dt.month == months).all()]
+        if len(matching) == 1:
+            return matching[0]
+    return formats[0]
+
+
+def _compact_numbers(numbers: pd.Series) -> pd.Series:
+    """
+    Downcast a numeric series without changing its values.
+
+    Whole-number floats become integers and integers shrink to at least
+    ``int32``; narrower types overflow too easily in generated arithmetic, and
+    fractional floats stay ``float64`` so money totals keep their precision.
+    """
+    if numbers.dtype.kind == "f":
+        finite = numbers.dropna()
+        if len(finite) != len(numbers) or not (finite == np.floor(finite)).all():
+            return numbers
+        if finite.abs().max() >= 2**63:
+            return numbers
+        numbers = numbers.astype("int64")
+    if numbers.dtype.kind in "iu" and len(numbers):
+        if np.iinfo("int32").min <= numbers.min() and numbers.max() <= np.iinfo("int32").max:
+            return numbers.astype("int32")
+    return numbers
+
+
+def infer_column(series: pd.Series) -> dict:
+    """
+    Decide how a raw column should be stored.
+
+    :param series: The column as loaded from the file.
+    :return: A schema entry such as ``{"kind": "numeric"}``, ``{"kind": "datetime", "format": ...}``,
+             ``{"kind": "category"}``, ``{"kind": "string"}`` or ``{"kind": "keep"}``. Date
+             entries list other formats that also fit under ``"alternatives"``.
+    """
+    if series.dtype.kind in "iuf":
+        return {"kind": "numeric"}
+    if series.dtype != "object":
+        return {"kind": "keep"}
+
+    text = series.dropna().astype(str).str.strip()
+    text = text[text != ""]
+    if text.empty:
+        return {"kind": "keep"}
+
+    numbers = _parse_numbers(text)
+    if numbers.notna().mean() >= PARSE_THRESHOLD and not text.isin(_ACCOUNTING_ZEROS).all():
+        return {"kind": "numeric"}
+
+    if text.str.match(_DATE_SHAPE).mean() >= PARSE_THRESHOLD:
+        formats = _date_formats(text)
+        if _parse_dates(text, formats[0]).notna().mean() >= PARSE_THRESHOLD:
+            return {"kind": "datetime", "format": formats[0], "alternatives": formats[1:]}
+
+    if pd.api.types.infer_dtype(series, skipna=True) != "string":
+        return {"kind": "keep"}
+    unique = text.nunique()
+    if unique <= CATEGORY_MAX_UNIQUE and unique <= CATEGORY_MAX_RATIO * len(text):
+        return {"kind": "category"}
+    return {"kind": "string"}
+
+
+def infer_schema(df: pd.DataFrame) -> dict:
+    """Infer a schema entry for every column of ``df``."""
+    schema = {col: infer_column(df[col]) for col in df.columns}
+    for col, entry in schema.items():
+        alternatives = entry.pop("alternatives", None)
+        if alternatives:
+            entry["format"] = _resolve_date_format(df, col, [entry["format"]] + alternatives)
+    return schema
+
+
+def apply_schema(df: pd.DataFrame, schema: dict) -> bool:
+    """
+    Convert the columns of ``df`` in place according to ``schema``.
+
+    Columns that already have their target type are left alone, so applying a
+    schema to a frame that was converted before is cheap.
+
+    :return: True when any column was converted.
+    """
+    changed = False
+    for col, entry in schema.items():
+        if col not in df.columns:
+            continue
+        series = df[col]
+        kind = entry.get("kind")
+        try:
+            if kind == "numeric":
+                if series.dtype == "object":
+                    series = _parse_numbers(series.astype("string").str.strip())
+                    series = series.astype("float64")
+                compact = _compact_numbers(series)
+                if compact.dtype != df[col].dtype:
+                    df[col] = compact
+                    changed = True
+            elif kind == "datetime" and series.dtype == "object":
+                df[col] = _parse_dates(series.astype("string").str.strip(), entry.get("format"))
+                changed = True
+            elif kind == "category" and series.dtype == "object":
+                df[col] = series.str.strip().astype("category")
+                changed = True
+            elif kind == "string" and series.dtype == "object":
+                stripped = series.str.strip()
+                if not stripped.equals(series):
+                    df[col] = stripped
+                    changed = True
+        except Exception as e:
+            logging.error(f"Error converting column {col} to {kind}: {e}")
+    return changed
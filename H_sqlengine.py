@@ -0,0 +1,195 @@
+import os
+import re
+import pathlib
+import sqlite3
+import logging
+import threading
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # the SQLite fallback is used instead
+    duckdb = None
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # frames are registered from memory instead of the columnar cache
+    feather = None
+
+# Rows of a query result returned to the agent
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", 200))
+_READ_ONLY = re.compile(r"^\s*(select|with|describe|show|summarize|explain)\b", re.IGNORECASE)
+
+
+def table_name(key: str) -> str:
+    """Turn a dataset key such as ``Financials.csv`` into a SQL table name (``financials``)."""
+    name = re.sub(r"\W+", "_", os.path.splitext(key)[0].lower()).strip("_")
+    if not name or name[0].isdigit():
+        name = f"t_{name}"
+    return name
+
+
+def describe_tables(handler) -> str:
+    """Describe each dataset of a DataHandler as ``table(column type, ...)`` from its profile."""
+    lines = []
+    for key in handler.keys():
+        columns = handler.get_profile(key)["columns"]
+        described = ", ".join(f"{col} {entry['dtype']}" for col, entry in columns.items())
+        lines.append(f"{table_name(key)}({described})")
+    return "\n".join(lines)
+
+
+def table_path(digest: str, engine: str) -> str:
+    """Return the database file holding one dataset for ``engine``; like the Feather cache, it is keyed by content."""
+    from H_datahandle import DATASET_CACHE_DIR, CACHE_FORMAT_VERSION
+
+    return os.path.join(DATASET_CACHE_DIR, f"{digest}-v{CACHE_FORMAT_VERSION}.{engine}")
+
+
+def backend() -> str:
+    """Return the configured SQL backend: ``duckdb``, ``sqlite`` or ``""`` when disabled (``SQL_ENGINE``, default off)."""
+    choice = os.getenv("SQL_ENGINE", "off").lower()
+    if choice in ("0", "off", "none", ""):
+        return ""
+    if choice == "auto":
+        return "duckdb" if duckdb is not None else "sqlite"
+    if choice == "duckdb" and duckdb is None:
+        logging.warning("SQL_ENGINE=duckdb but duckdb is not installed; falling back to SQLite.")
+        return "sqlite"
+    return choice
+
+
+class SQLEngine:
+    """
+    Read-only SQL over a DataHandler's datasets.
+
+    Each dataset is copied once into a DuckDB (or, without DuckDB, SQLite)
+    file next to its Feather cache, keyed by the same content digest, so
+    sessions and restarts reuse it. The files are attached read-only and
+    exposed as views named after the datasets. DuckDB scans them vectorized
+    and out of core, and only the result is materialized.
+    """
+
+    def __init__(self, handler, engine: str = None):
+        """
+        :param handler: The DataHandler whose loaded datasets become tables.
+        :param engine: ``duckdb`` or ``sqlite`` (defaults to ``backend()``).
+        """
+        self.handler = handler
+        self.engine = engine or backend() or "sqlite"
+        self._lock = threading.Lock()
+        self._version = None
+        self._conn = None
+
+    def _connect(self) -> None:
+        """(Re)build the connection when the handler's datasets have changed."""
+        version = self.handler.version()
+        if self._conn is not None and version == self._version:
+            return
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        files = {}
+        for key in self.handler.keys():
+            digest = self.handler.get_digest(key)
+            if digest not in files:
+                files[digest] = self._table_file(key, digest)
+        self._conn = self._open_duckdb(files) if self.engine == "duckdb" else self._open_sqlite(files)
+        self._version = version
+        logging.info(f"SQL engine ({self.engine}) registered: {', '.join(map(table_name, self.handler.keys()))}")
+
+    def _table_file(self, key: str, digest: str) -> str:
+        """Return the database file of a dataset, writing it (atomically) on first use."""
+        path = table_path(digest, self.engine)
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if self.engine == "duckdb":
+                conn = duckdb.connect(tmp_path)
+                cache = self.handler.cache_path(digest)
+                if feather is not None and os.path.exists(cache):
+                    source = feather.read_table(cache, memory_map=True)
+                else:
+                    source = self.handler.get_data(key)
+                conn.register("source", source)
+                conn.execute("CREATE TABLE data AS SELECT * FROM source")
+            else:
+                conn = sqlite3.connect(tmp_path)
+                self.handler.get_data(key).to_sql("data", conn, index=False, chunksize=50_000)
+                conn.commit()
+            conn.close()
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def _open_duckdb(self, files: dict):
+        digests = list(files)
+        # The first file is the main database, opened read-only; the others are attached read-only
+        conn = duckdb.connect(files[digests[0]], read_only=True)
+        aliases = {digests[0]: conn.execute("SELECT current_database()").fetchone()[0]}
+        for i, digest in enumerate(digests[1:], 1):
+            aliases[digest] = f"d{i}"
+            conn.execute(f"ATTACH '{files[digest]}' AS d{i} (READ_ONLY)")
+        for key in self.handler.keys():
+            alias = aliases[self.handler.get_digest(key)]
+            conn.execute(f'CREATE TEMP VIEW "{table_name(key)}" AS SELECT * FROM "{alias}".main.data')
+        # From here on queries may only read the attached files, not arbitrary files or URLs
+        conn.execute("SET enable_external_access = false")
+        return conn
+
+    def _open_sqlite(self, files: dict):
+        conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False)
+        aliases = {}
+        for i, (digest, path) in enumerate(files.items()):
+            aliases[digest] = f"d{i}"
+            conn.execute("ATTACH DATABASE ? AS ?", (f"{pathlib.Path(path).absolute().as_uri()}?mode=ro", f"d{i}"))
+        for key in self.handler.keys():
+            alias = aliases[self.handler.get_digest(key)]
+            conn.execute(f'CREATE TEMP VIEW "{table_name(key)}" AS SELECT * FROM {alias}.data')
+        # Rejects every write, including a DELETE hidden behind a WITH clause
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def query(self, sql: str, max_rows: int = None) -> tuple:
+        """
+        Run a read-only query.
+
+        :param sql: A SELECT (or WITH/DESCRIBE/SHOW/SUMMARIZE/EXPLAIN) statement.
+        :param max_rows: How many result rows to fetch (``SQL_MAX_ROWS``, default 200).
+        :return: ``(frame, truncated)``; ``truncated`` is True when more rows matched.
+        """
+        sql = sql.strip().strip("`").strip()
+        sql = re.sub(r"^sql\s+", "", sql, flags=re.IGNORECASE).rstrip(";").strip()
+        if not _READ_ONLY.match(sql) or ";" in sql:
+            raise ValueError("Only a single read-only SELECT statement is allowed.")
+        max_rows = max_rows or SQL_MAX_ROWS
+        with self._lock:
+            self._connect()
+            if self.engine == "duckdb":
+                frame = self._conn.execute(sql).fetch_df_chunk(vectors_per_chunk=1 + max_rows // 2048)
+            else:
+                cursor = self._conn.execute(sql)
+                rows = cursor.fetchmany(max_rows + 1)
+                frame = pd.DataFrame(rows, columns=[d[0] for d in cursor.description])
+        return frame.head(max_rows), len(frame) > max_rows
+
+    def run(self, sql: str) -> str:
+        """Run a query and render the result (or the error) as an agent observation."""
+        try:
+            frame, truncated = self.query(sql)
+        except Exception as e:
+            return f"SQL error: {e}"
+        text = frame.to_string(index=False) if len(frame) else "(no rows)"
+        if truncated:
+            text += f"\n(showing the first {len(frame)} rows; aggregate or add LIMIT for fewer)"
+        return text
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,263 @@
+import re
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Rough characters-per-token ratio used for the reported token usage
+CHARS_PER_TOKEN = 4
+# Characters per streamed chunk
+STREAM_CHUNK_CHARS = 16
+
+# Default pandas code per question pattern; a list runs as several agent iterations
+DEFAULT_SCRIPT = [
+    {"match": r"average|mean", "code": "df.select_dtypes('number').mean()"},
+    {"match": r"how many|count|number of", "code": "len(df)"},
+    {"match": r"total|sum", "code": "df.select_dtypes('number').sum()"},
+    {"match": r"top|highest|largest|best", "code": "df.select_dtypes('number').max()"},
+    {"match": r".", "code": ["df.shape", "df.describe()"]},
+]
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _text(content) -> str:
+    """Flatten OpenAI message content, which may be a list of parts."""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class StubLLM:
+    """
+    Scripted replies for the three agents of the pipeline.
+
+    * The supervisor's ReAct prompt gets ``Action: pandas_agent`` with the question,
+      then a ``Final Answer`` quoting the last observation.
+    * Function-calling requests (the pandas agent) get one ``python_repl_ast`` call
+      per scripted code step, then an answer quoting the last function result.
+    * Anything else (summaries, memory folds) gets a short canned summary.
+    """
+
+    def __init__(self, script: list = None, latency: float = 0.0, token_latency: float = 0.0):
+        """
+        :param script: ``[{"match": regex, "code": str | [str, ...]}]``, first match wins.
+        :param latency: Seconds to wait before each reply (time to first token).
+        :param token_latency: Seconds between streamed chunks.
+        """
+        self.script = [(re.compile(entry["match"], re.IGNORECASE), entry["code"]) for entry in script or DEFAULT_SCRIPT]
+        self.latency = latency
+        self.token_latency = token_latency
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "by_kind": {}}
+
+    def codes_for(self, question: str) -> list:
+        for pattern, code in self.script:
+            if pattern.search(question):
+                return [code] if isinstance(code, str) else list(code)
+        return ["df.shape"]
+
+    def reply(self, request: dict) -> tuple:
+        """Return ``(kind, message)`` for a chat-completions request body."""
+        messages = request.get("messages", [])
+        if request.get("functions") or request.get("tools"):
+            return "pandas", self._pandas_reply(messages)
+        prompt = "\n".join(_text(m.get("content")) for m in messages)
+        if "Do I need to use a tool?" in prompt:
+            return "supervisor", self._react_reply(prompt)
+        last = _text(messages[-1].get("content")) if messages else ""
+        last_line = last.strip().splitlines()[-1] if last.strip() else ""
+        return "summary", {"role": "assistant", "content": f"Summary: {last_line[:200]}"}
+
+    def _react_reply(self, prompt: str) -> dict:
+        scratchpad = prompt.rsplit("New input:", 1)[-1]
+        question = scratchpad.strip().splitlines()[0] if scratchpad.strip() else ""
+        observations = re.findall(r"Observation:\s*(.*?)(?:\nThought:|$)", scratchpad, re.DOTALL)
+        if observations:
+            answer = observations[-1].strip() or "No result."
+            content = f"Thought: Do I need to use a tool? No\nFinal Answer: {answer}"
+        else:
+            content = f"Thought: Do I need to use a tool? Yes\nAction: pandas_agent\nAction Input: {question}"
+        return {"role": "assistant", "content": content}
+
+    def _pandas_reply(self, messages: list) -> dict:
+        question = next((_text(m.get("content")) for m in messages if m.get("role") == "user"), "")
+        results = [_text(m.get("content")) for m in messages if m.get("role") in ("function", "tool")]
+        system = " ".join(_text(m.get("content")) for m in messages if m.get("role") == "system")
+        codes = self.codes_for(question)
+        if len(results) < len(codes):
+            code = codes[len(results)]
+            if "`df1`" in system:
+                # Several frames are named df1, df2, ...; the script targets the first one
+                code = re.sub(r"\bdf\b", "df1", code)
+            arguments = json.dumps({"query": code})
+            return {"role": "assistant", "content": None,
+                    "function_call": {"name": "python_repl_ast", "arguments": arguments}}
+        answer = results[-1].strip() if results else "No result."
+        return {"role": "assistant", "content": f"The result is:\n{answer}"}
+
+    def record(self, kind: str, request: dict, message: dict) -> dict:
+        """Count the tokens of one exchange and return the usage block for the response."""
+        prompt = json.dumps(request.get("messages", []), ensure_ascii=False)
+        completion = (message.get("content") or "") + json.dumps(message.get("function_call") or "")
+        usage = {"prompt_tokens": _count_tokens(prompt), "completion_tokens": _count_tokens(completion)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += usage["prompt_tokens"]
+            self.stats["completion_tokens"] += usage["completion_tokens"]
+            entry = self.stats["by_kind"].setdefault(kind, {"requests": 0, "prompt_tokens": 0})
+            entry["requests"] += 1
+            entry["prompt_tokens"] += usage["prompt_tokens"]
+        return usage
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "by_kind": {}}
+
+
+def _make_handler(stub: StubLLM):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logging.debug("stub llm: " + format, *args)
+
+        def _send_json(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, stub.snapshot())
+            elif self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_DELETE(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                stub.reset()
+                self._send_json(200, {})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            kind, message = stub.reply(request)
+            usage = stub.record(kind, request, message)
+            if stub.latency:
+                time.sleep(stub.latency)
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            base = {"id": completion_id, "created": int(time.time()), "model": request.get("model", "stub")}
+            finish = "function_call" if message.get("function_call") else "stop"
+            if not request.get("stream"):
+                self._send_json(200, {
+                    **base, "object": "chat.completion",
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def send(delta: dict, finish_reason=None) -> None:
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+
+            send({"role": "assistant", "content": ""})
+            if message.get("function_call"):
+                call = message["function_call"]
+                send({"function_call": {"name": call["name"], "arguments": ""}})
+                pieces = [{"function_call": {"arguments": part}} for part in _chunks(call["arguments"])]
+            else:
+                pieces = [{"content": part} for part in _chunks(message["content"])]
+            for delta in pieces:
+                if stub.token_latency:
+                    time.sleep(stub.token_latency)
+                send(delta)
+            send({}, finish)
+            if (request.get("stream_options") or {}).get("include_usage"):
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def _chunks(text: str) -> list:
+    return [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+
+
+class StubServer:
+    """An OpenAI-compatible chat-completions server backed by ``StubLLM``, run on a daemon thread."""
+
+    def __init__(self, stub: StubLLM = None, host: str = "127.0.0.1", port: int = 0):
+        self.stub = stub or StubLLM()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.stub))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible stub for the agent pipeline.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--script", help="JSON file of [{\"match\": regex, \"code\": str | [str]}]")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+    server = StubServer(StubLLM(script, args.latency, args.token_latency), args.host, args.port)
+    print(f"Stub LLM listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,133 @@
 # -----------------------------------------------------------------------
 # this is main
 from dotenv import load_dotenv
+import asyncio
+import copy
 import os
+import time
 from langchain.agents import AgentExecutor, create_react_agent
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import ChatOpenAI
-from langchain import hub
-from H_pandas import PandasAgent
+from H_memory import RollingSummaryMemory
+from H_llmclient import chat_model
+from H_modelrouter import HedgedChatModel
+from H_intent import get_intent_classifier, column_matches, has_inline_text
+from H_pandas import PandasAgent, AGENT_STOPPED
 from langchain_core.tools import Tool
 from H_sammary import SummaryAgent
+import H_eventloop
+from H_answercache import get_answer_cache
+from H_prompts import get_prompt_registry
+from H_sqlengine import SQLEngine, backend as sql_backend, describe_tables
+from H_tracing import get_tracer, new_trace_id, span, TracingCallbackHandler
+
+# The react-chat prompt introduces the answer shown to the user with this marker
+FINAL_ANSWER_MARKER = "Final Answer:"
+
 
 class TyphoonAgent:
-    def __init__(self, temperature: float, base_url: str, model_name: str, dataset_paths: dict):
+    def __init__(self, temperature: float, base_url: str, model_name: str, dataset_paths: dict, router=None):
         self.temperature = temperature
         self.base_url = base_url
         self.model = model_name
         self.api_key = os.getenv("TYPHOON_API_KEY")
+        self.router = router
         self.llm = self.initialize_llm()
+        self.pandas_agent = PandasAgent(temperature, base_url, model_name, dataset_paths,
+                                        llm=self.routed_llm("pandas"))
+        self.summary_agent = SummaryAgent(temperature, base_url, model_name, llm=self.routed_llm("summary"))
         self.memory = self.initialize_memory()
-        self.pandas_agent = PandasAgent(temperature, base_url, model_name, dataset_paths)
-        self.summary_agent = SummaryAgent(temperature, base_url, model_name)
+        self.answer_cache = get_answer_cache()
+        self.intent_classifier = get_intent_classifier()
+        # Column names come from the profiles, so routing a query never touches the frames
+        handler = self.pandas_agent.handler
+        self.dataset_columns = [column for key in handler.keys() for column in handler.get_profile(key)["columns"]]
+        self.sql_engine = None
         self.tools = self.initialize_tools()
         self.agent = self.create_agent()
         self.agent_executor = self.create_agent_executor()
 
-    def initialize_llm(self) -> ChatOpenAI:
+    def initialize_llm(self):
         """Initialize the language model."""
-        return ChatOpenAI(
+        if self.router is not None:
+            return self.routed_llm("supervisor")
+        return chat_model(
             base_url=self.base_url,
             model=self.model,
             api_key=self.api_key,
             temperature=self.temperature,
         )
 
+    def routed_llm(self, role: str):
+        """
+        Build the model for one agent role through the model router.
+
+        Args:
+            role (str): ``supervisor``, ``pandas`` or ``summary``.
+
+        Returns:
+            HedgedChatModel | None: The routed model, or None when no router is configured.
+        """
+        if self.router is None:
+            return None
+        return HedgedChatModel(router=self.router, role=role, model_name=self.model, temperature=self.temperature)
+
     def initialize_memory(self):
-        """Set up memory for the conversation."""
-        return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        """Set up token-budgeted memory; older turns are summarized by the summary agent's LLM."""
+        return RollingSummaryMemory(llm=self.summary_agent.llm, memory_key="chat_history", return_messages=True)
 
     def initialize_tools(self):
         """Initialize the tools used by the TyphoonAgent."""
         pandas_tool = Tool(
             name="pandas_agent",
             func=self.query_dataframe,
+            coroutine=self.aquery_dataframe,
             description="Usefull when you need to Consult the PandasAgent to analyze and visualize data in a DataFrame.",
         )
 
         summary_tool = Tool(
             name="summary_agent",
             func=self.summary_answer,
+            coroutine=self.asummary_answer,
             description="Usefull when you need to summarizing responses from other agents or condensing user input for clarity and concise communication.",
         )
-        return [pandas_tool, summary_tool]
+        tools = [pandas_tool, summary_tool]
+
+        engine = sql_backend()
+        if engine:
+            self.sql_engine = SQLEngine(self.pandas_agent.handler, engine)
+            sql_tool = Tool(
+                name="sql_agent",
+                func=self.query_sql,
+                coroutine=self.aquery_sql,
+                description=(
+                    "Usefull for aggregations, filters and joins over large datasets. Input is one read-only "
+                    f"SQL SELECT statement ({'DuckDB' if engine == 'duckdb' else 'SQLite'} dialect); only the result rows "
+                    "are returned. Tables:\n"
+                    + describe_tables(self.pandas_agent.handler)
+                ),
+            )
+            tools.append(sql_tool)
+        return tools
+
+    def query_sql(self, sql: str) -> str:
+        """Run a read-only SQL query over the loaded datasets."""
+        return self.sql_engine.run(sql)
+
+    async def aquery_sql(self, sql: str) -> str:
+        """Asynchronous counterpart of ``query_sql``; the query runs off the event loop."""
+        return await asyncio.to_thread(self.sql_engine.run, sql)
+
+    def close(self) -> None:
+        """Release the SQL connection and the datasets shared by this agent and all of its memory views."""
+        if self.sql_engine is not None:
+            self.sql_engine.close()
+        self.pandas_agent.handler.close()
     
     def summary_answer(self, user_input: str) -> None:
         return self.summary_agent.summarize(user_input)
 
+    async def asummary_answer(self, user_input: str) -> str:
+        return await self.summary_agent.asummarize(user_input)
+
     def query_dataframe(self, user_input: str) -> None:
         """
         Delegate the user query to the PandasAgent for processing.
@@ -66,33 +139,281 @@ class TyphoonAgent:
             str: The processed result from the PandasAgent.
         """
         return self.pandas_agent.run(user_input)
+
+    async def aquery_dataframe(self, user_input: str) -> str:
+        """Asynchronous counterpart of ``query_dataframe``."""
+        return await self.pandas_agent.arun(user_input)
     
 
     def create_agent(self):
         """Create a React agent that works with tools."""
-        react_prompt = hub.pull(os.getenv("REACT_PROMPT", "hwchase17/react-chat"))
+        prompt_name = os.getenv("REACT_PROMPT", "hwchase17/react-chat")
+        with span("prompt_pull", prompt_name):
+            react_prompt = get_prompt_registry().get(prompt_name)
         return create_react_agent(llm=self.llm, tools=self.tools, prompt=react_prompt)
 
-    def create_agent_executor(self):
+    def create_agent_executor(self, memory=None):
         """Create the agent executor to handle queries."""
         return AgentExecutor(
             agent=self.agent,
             tools=self.tools,
-            memory=self.memory,
+            memory=memory if memory is not None else self.memory,
             verbose=True,
             max_iterations=int(os.getenv("MAX_ITERATIONS", 20)),
             handle_parsing_errors=True,
         )
 
-    def process_query(self, user_input: str) -> None:
-        """Process user input by delegating to the appropriate agent/tool."""
+    def bind_memory(self, memory) -> "TyphoonAgent":
+        """
+        Return a view of this agent that talks through its own conversation memory.
+
+        The LLMs, tools and sub-agents are shared with this instance; only the
+        memory and the (cheap) agent executor are new.
+
+        Args:
+            memory: The conversation memory for the new view.
+
+        Returns:
+            TyphoonAgent: A shallow copy bound to ``memory``.
+        """
+        bound = copy.copy(self)
+        bound.memory = memory
+        bound.agent_executor = bound.create_agent_executor(memory)
+        return bound
+
+    def cached_answer(self, user_input: str):
+        """
+        Look up a cached answer for the query and, on a hit, record the turn in memory.
+
+        Args:
+            user_input (str): The user's query.
+
+        Returns:
+            str | None: The cached answer, or None on a miss.
+        """
+        if self.answer_cache is None:
+            return None
+        answer = self.answer_cache.lookup(user_input, self.pandas_agent.handler.version(), self.model)
+        if answer is not None:
+            self.memory.save_context({"input": user_input}, {"output": answer})
+        return answer
+
+    def remember_answer(self, user_input: str, answer: str) -> None:
+        """Store a fresh answer in the answer cache."""
+        if self.answer_cache is not None:
+            self.answer_cache.store(user_input, self.pandas_agent.handler.version(), self.model, answer)
+
+    def classify_intent(self, user_input: str) -> tuple:
+        """
+        Decide whether a query can skip the ReAct supervisor.
+
+        Args:
+            user_input (str): The user's query.
+
+        Returns:
+            tuple: ``(route, columns_named)``; route is ``data`` (PandasAgent), ``summary``
+            (SummaryAgent) or ``agent`` (the supervisor), and columns_named counts the
+            dataset columns the query mentions.
+        """
+        columns_named = column_matches(user_input, self.dataset_columns)
+        if self.intent_classifier is None:
+            return "agent", columns_named
+        route = self.intent_classifier.route(user_input, self.dataset_columns)
+        if route == "summary" and not has_inline_text(user_input):
+            # "Give me a recap of the conversation" needs the supervisor's memory, not the question summarized
+            route = "agent"
+        return route, columns_named
+
+    def direct_answer(self, route: str, user_input: str) -> str:
+        """Answer a ``data`` or ``summary`` query with its agent directly; raises if the agent fails."""
+        with span("tool", f"direct_{route}"):
+            if route == "data":
+                answer = self.pandas_agent.analyze(user_input)
+            else:
+                answer = self.summary_agent.generate(user_input)
+        self.memory.save_context({"input": user_input}, {"output": answer})
+        return answer
+
+    async def adirect_answer(self, route: str, user_input: str) -> str:
+        """Asynchronous counterpart of ``direct_answer``."""
+        with span("tool", f"direct_{route}"):
+            if route == "data":
+                answer = await self.pandas_agent.aanalyze(user_input)
+            else:
+                answer = await self.summary_agent.agenerate(user_input)
+        await self.memory.asave_context({"input": user_input}, {"output": answer})
+        return answer
+
+    @staticmethod
+    def result(answer: str = None, error: str = None) -> dict:
+        """Build the ``{"ok", "answer", "error"}`` status of a turn; a supervisor that gave up is a failure."""
+        if error is None and answer is not None and answer.startswith(AGENT_STOPPED):
+            error = answer
+        return {"ok": error is None, "answer": answer if error is None else None, "error": error}
+
+    def remembered(self, user_input: str, result: dict) -> dict:
+        """Store a turn's answer in the answer cache if it succeeded, and return the result."""
+        if result["ok"]:
+            self.remember_answer(user_input, result["answer"])
+        return result
+
+    def respond(self, user_input: str, trace_id: str = None) -> dict:
+        """
+        Answer a query and report whether that worked.
+
+        Every route goes through the answer cache (follow-up questions never hit it),
+        and only successful answers are stored.
+
+        Args:
+            user_input (str): The user's query.
+            trace_id (str): Records the turn's spans under this id.
+
+        Returns:
+            dict: ``{"ok", "answer", "error"}``.
+        """
+        try:
+            with get_tracer().trace(trace_id, question=user_input) as attrs:
+                route, attrs["columns_named"] = self.classify_intent(user_input)
+                attrs["route"] = route
+                cached = self.cached_answer(user_input)
+                attrs["cached"] = cached is not None
+                if cached is not None:
+                    return self.result(cached)
+                if route != "agent":
+                    answer = self.direct_answer(route, user_input)
+                    self.remember_answer(user_input, answer)
+                    return self.result(answer)
+                print("> Entering TyphoonAgent...")
+                response = self.agent_executor.invoke(
+                    {"input": user_input}, {"callbacks": [TracingCallbackHandler()]}
+                )
+                print("> Finished TyphoonAgent Response:")
+                print(response["output"])
+                return self.remembered(user_input, self.result(response["output"]))
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return self.result(error=str(e))
+
+    async def arespond(self, user_input: str, trace_id: str = None) -> dict:
+        """Asynchronous counterpart of ``respond``; tools run through their async paths."""
         try:
-            print("> Entering TyphoonAgent...")
-            response = self.agent_executor.invoke({"input": user_input})
-            print("> Finished TyphoonAgent Response:")
-            print(response["output"])
+            with get_tracer().trace(trace_id, question=user_input) as attrs:
+                route, attrs["columns_named"] = self.classify_intent(user_input)
+                attrs["route"] = route
+                cached = self.cached_answer(user_input)
+                attrs["cached"] = cached is not None
+                if cached is not None:
+                    return self.result(cached)
+                if route != "agent":
+                    answer = await self.adirect_answer(route, user_input)
+                    self.remember_answer(user_input, answer)
+                    return self.result(answer)
+                response = await self.agent_executor.ainvoke(
+                    {"input": user_input}, {"callbacks": [TracingCallbackHandler()]}
+                )
+                return self.remembered(user_input, self.result(response["output"]))
         except Exception as e:
             print(f"An error occurred: {e}")
+            return self.result(error=str(e))
+
+    def process_query(self, user_input: str, trace_id: str = None) -> str:
+        """Process user input by delegating to the appropriate agent/tool."""
+        result = self.respond(user_input, trace_id)
+        return result["answer"] if result["ok"] else f"An error occurred: {result['error']}"
+
+    async def aprocess_query(self, user_input: str, trace_id: str = None) -> str:
+        """Process user input on the event loop; tools run through their async paths."""
+        result = await self.arespond(user_input, trace_id)
+        return result["answer"] if result["ok"] else f"An error occurred: {result['error']}"
+
+    async def astream_query(self, user_input: str, trace_id: str = None):
+        """
+        Stream the agent's progress on a query from the executor's event stream.
+
+        Args:
+            user_input (str): The user's query.
+            trace_id (str): Records the turn's spans under this id (a new one if omitted).
+
+        Yields:
+            tuple: ``("step", text)`` whenever a tool is called, ``("token", text)`` for
+            each new piece of the final answer, and finally ``("final", output)``.
+        """
+        # The generator may resume on different tasks, so the turn span is recorded
+        # explicitly instead of through the tracer's context variables
+        tracer = get_tracer()
+        trace_id = trace_id or new_trace_id()
+        turn_start, started = time.time(), time.perf_counter()
+        route, columns_named = self.classify_intent(user_input)
+        cached = self.cached_answer(user_input)
+        if cached is not None:
+            tracer.record("turn", "turn", turn_start, time.perf_counter() - started, trace_id=trace_id,
+                          span_id=trace_id[:16], question=user_input, cached=True, route=route,
+                          columns_named=columns_named)
+            yield ("final", cached)
+            return
+
+        if route != "agent":
+            yield ("step", f"{route}: {user_input}")
+            # Nothing is yielded while the answer is computed, so the tracer's context can be used here
+            try:
+                with tracer.trace(trace_id, question=user_input, cached=False, route=route, columns_named=columns_named):
+                    answer = await self.adirect_answer(route, user_input)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                yield ("final", f"An error occurred: {e}")
+                return
+            self.remember_answer(user_input, answer)
+            yield ("final", answer)
+            return
+
+        handler = TracingCallbackHandler(tracer, trace_id, parent_id=trace_id[:16])
+        output = None
+        try:
+            root_run_id = None
+            buffers = {}
+            sent = {}
+            async for event in self.agent_executor.astream_events(
+                {"input": user_input}, {"callbacks": [handler]}, version="v2"
+            ):
+                kind = event["event"]
+                if root_run_id is None:
+                    root_run_id = event["run_id"]
+
+                if kind == "on_chain_stream" and event["run_id"] == root_run_id:
+                    chunk = event["data"]["chunk"]
+                    for action in chunk.get("actions", []):
+                        yield ("step", f"{action.tool}: {action.tool_input}")
+                    if "output" in chunk:
+                        output = chunk["output"]
+                        yield ("final", output)
+                elif kind in ("on_chat_model_stream", "on_llm_stream"):
+                    chunk = event["data"]["chunk"]
+                    text = getattr(chunk, "content", None) or getattr(chunk, "text", "")
+                    if not isinstance(text, str) or not text:
+                        continue
+                    run_id = event["run_id"]
+                    buffer = buffers.get(run_id, "") + text
+                    buffers[run_id] = buffer
+                    marker = buffer.find(FINAL_ANSWER_MARKER)
+                    if marker < 0:
+                        continue
+                    start = sent.get(run_id, marker + len(FINAL_ANSWER_MARKER))
+                    new_text = buffer[start:]
+                    if run_id not in sent:
+                        new_text = new_text.lstrip()
+                    sent[run_id] = len(buffer)
+                    if new_text:
+                        yield ("token", new_text)
+            if output is not None:
+                self.remembered(user_input, self.result(output))
+        finally:
+            tracer.record("turn", "turn", turn_start, time.perf_counter() - started, trace_id=trace_id,
+                          span_id=trace_id[:16], question=user_input, cached=False, route=route,
+                          columns_named=columns_named)
+
+    def stream_query(self, user_input: str, trace_id: str = None):
+        """Synchronous wrapper that streams ``astream_query`` on the shared event loop."""
+        return H_eventloop.iterate(self.astream_query(user_input, trace_id))
 
     def run(self):
         """Start the TyphoonAgent loop for user interaction."""
@@ -106,19 +427,42 @@ class TyphoonAgent:
             self.process_query(user_input)
 
 if __name__ == "__main__":
+    import argparse
+    import json
+    import logging
+    from H_batch import BatchRunner, load_questions
+
     load_dotenv()
-    
-    filepaths = ['./McDonald_s_Reviews.csv', './Financials.csv']
+
+    parser = argparse.ArgumentParser(description="Ask the Typhoon agent questions interactively or in a batch.")
+    parser.add_argument("--datasets", nargs="+", default=['./McDonald_s_Reviews.csv', './Financials.csv'])
+    parser.add_argument("--batch", help="JSONL or CSV file of questions to answer instead of the interactive loop")
+    parser.add_argument("--output", default="batch_results.jsonl",
+                        help="JSONL results file; questions already answered in it are skipped")
+    parser.add_argument("--concurrency", type=int, help="questions in flight at once (default 4)")
+    parser.add_argument("--rate", type=float, help="question starts per second (default unlimited)")
+    parser.add_argument("--base-url", default="https://api.opentyphoon.ai/v1")
+    parser.add_argument("--model", default="typhoon-v1.5x-70b-instruct")
+    parser.add_argument("--temperature", type=float, default=0.1)
+    args = parser.parse_args()
 
     def get_filepath(filepaths: list) -> bool:
         return {filepath.split('/')[-1]: filepath for filepath in filepaths}
     
-    file_paths = get_filepath(filepaths=filepaths)
+    file_paths = get_filepath(filepaths=args.datasets)
+    # Read the questions first, so a bad batch file fails before the agent is built
+    questions = load_questions(args.batch) if args.batch else None
 
     agent = TyphoonAgent(
-        temperature=0.1,
-        base_url="https://api.opentyphoon.ai/v1",
-        model_name="typhoon-v1.5x-70b-instruct", 
+        temperature=args.temperature,
+        base_url=args.base_url,
+        model_name=args.model, 
         dataset_paths=file_paths
     )
-    agent.run()
+    if args.batch:
+        logging.basicConfig(level=logging.INFO)
+        runner = BatchRunner(agent, concurrency=args.concurrency, rate=args.rate)
+        summary = H_eventloop.run(runner.run(questions, args.output))
+        print(json.dumps(summary))
+    else:
+        agent.run()
@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Spans kept in memory for the live percentiles
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", 5000))
+# Rough characters-per-token ratio for LLM calls that report no token usage
+CHARS_PER_TOKEN = 4
+# Tool calls recorded under their own stage rather than "tool"
+TOOL_STAGES = {"python_repl_ast": "code_execution"}
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def aggregate(spans) -> dict:
+    """
+    Summarize spans per stage.
+
+    :param spans: An iterable of span dicts.
+    :return: ``{stage: {"count", "p50", "p95", "max", "total"}}`` with durations in seconds.
+    """
+    durations = {}
+    for span in spans:
+        durations.setdefault(span["stage"], []).append(span["duration"])
+    return {
+        stage: {
+            "count": len(values),
+            "p50": round(_percentile(values, 0.5), 4),
+            "p95": round(_percentile(values, 0.95), 4),
+            "max": round(max(values), 4),
+            "total": round(sum(values), 4),
+        }
+        for stage, values in sorted(durations.items())
+    }
+
+
+class Tracer:
+    """
+    Records timed spans as JSON lines and keeps recent ones in memory for percentiles.
+
+    A span is ``{"trace_id", "span_id", "parent_id", "stage", "name", "start",
+    "duration", "attrs"}``; all spans of one user turn share a trace id, spans
+    recorded outside a turn (startup work) have none.
+    """
+
+    def __init__(self, path: str = None, buffer: int = TRACE_BUFFER):
+        """
+        :param path: The JSON-lines file to append spans to (``TRACE_FILE``, default
+                     ``traces.jsonl``; an empty value keeps spans in memory only).
+        :param buffer: How many recent spans to keep in memory.
+        """
+        self.path = path if path is not None else os.getenv("TRACE_FILE", "traces.jsonl")
+        self._spans = deque(maxlen=buffer)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, name: str, start: float, duration: float, trace_id: str = None,
+               parent_id: str = None, span_id: str = None, **attrs) -> dict:
+        """Record a finished span; ``start`` is a Unix timestamp."""
+        span = {
+            "trace_id": trace_id if trace_id is not None else _current_trace.get(),
+            "span_id": span_id or uuid.uuid4().hex[:16],
+            "parent_id": parent_id if parent_id is not None else _current_span.get(),
+            "stage": stage,
+            "name": name,
+            "start": round(start, 6),
+            "duration": round(duration, 6),
+            "attrs": attrs,
+        }
+        with self._lock:
+            self._spans.append(span)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+                except OSError as e:
+                    logging.warning(f"Could not write trace span to {self.path}: {e}")
+        return span
+
+    @contextlib.contextmanager
+    def span(self, stage: str, name: str = None, **attrs):
+        """Time the enclosed block as a span; spans opened inside it become its children."""
+        span_id = uuid.uuid4().hex[:16]
+        parent_id = _current_span.get()
+        token = _current_span.set(span_id)
+        start, started = time.time(), time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self.record(stage, name or stage, start, time.perf_counter() - started,
+                        parent_id=parent_id, span_id=span_id, **attrs)
+
+    @contextlib.contextmanager
+    def trace(self, trace_id: str = None, name: str = "turn", **attrs):
+        """
+        Run the enclosed block as one turn: a root ``turn`` span under a fresh (or given) trace id.
+
+        Yields the turn span's attributes so the block can add to them.
+        """
+        token = _current_trace.set(trace_id or new_trace_id())
+        try:
+            with self.span("turn", name, **attrs) as turn_attrs:
+                yield turn_attrs
+        finally:
+            _current_trace.reset(token)
+
+    def spans(self, trace_id: str = None) -> list:
+        """Return the in-memory spans, optionally only those of one trace, oldest first."""
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id is None:
+            return spans
+        return [span for span in spans if span["trace_id"] == trace_id]
+
+    def stats(self) -> dict:
+        """Return p50/p95 per stage over the in-memory spans."""
+        return aggregate(self.spans())
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Record LangChain LLM and tool runs as spans of one trace."""
+
+    def __init__(self, tracer: Tracer = None, trace_id: str = None, parent_id: str = None):
+        """
+        :param tracer: Where to record spans (defaults to the process-wide tracer).
+        :param trace_id: The turn's trace id (defaults to the current trace).
+        :param parent_id: The span top-level runs hang under (defaults to the current span).
+        """
+        self.tracer = tracer or get_tracer()
+        self.trace_id = trace_id if trace_id is not None else _current_trace.get()
+        self.parent_id = parent_id if parent_id is not None else _current_span.get()
+        self._runs = {}
+        self._chains = {}
+
+    def _parent(self, parent_run_id) -> str:
+        # Chains are not recorded; hang spans under the nearest recorded ancestor instead
+        while parent_run_id in self._chains:
+            parent_run_id = self._chains[parent_run_id]
+        return str(parent_run_id) if parent_run_id is not None else self.parent_id
+
+    def _start(self, run_id, parent_run_id, stage: str, name: str, **attrs) -> None:
+        self._runs[run_id] = (stage, name, self._parent(parent_run_id), time.time(), time.perf_counter(), attrs)
+
+    def _end(self, run_id, **attrs) -> None:
+        entry = self._runs.pop(run_id, None)
+        if entry is None:
+            return
+        stage, name, parent_id, start, started, start_attrs = entry
+        self.tracer.record(stage, name, start, time.perf_counter() - started, trace_id=self.trace_id,
+                           parent_id=parent_id, span_id=str(run_id), **start_attrs, **attrs)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._chains[run_id] = parent_run_id
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", _model_name(serialized, kwargs),
+                    prompt_chars=sum(len(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        chars = sum(len(str(m.content)) for batch in messages for m in batch)
+        self._start(run_id, parent_run_id, "llm", _model_name(serialized, kwargs), prompt_chars=chars)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = _token_usage(response)
+        routed = _routed_model(response)
+        if routed and run_id in self._runs:
+            # A routed (and possibly hedged) call names the model that actually answered
+            self._runs[run_id] = self._runs[run_id][:1] + (routed,) + self._runs[run_id][2:]
+        if "prompt_tokens" not in usage and run_id in self._runs:
+            # Streamed responses usually carry no usage; estimate from the prompt size
+            usage["prompt_tokens"] = self._runs[run_id][5]["prompt_chars"] // CHARS_PER_TOKEN
+            usage["estimated"] = True
+        self._end(run_id, **usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=f"{type(error).__name__}: {error}")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start(run_id, parent_run_id, TOOL_STAGES.get(name, "tool"), name, input_chars=len(str(input_str)))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=f"{type(error).__name__}: {error}")
+
+
+def _model_name(serialized: dict, kwargs: dict) -> str:
+    params = kwargs.get("invocation_params") or {}
+    return params.get("model") or params.get("model_name") or (serialized or {}).get("name") or "llm"
+
+
+def _routed_model(response):
+    """Return the model a HedgedChatModel call was served by, if the response says."""
+    routed = (response.llm_output or {}).get("routed_model")
+    if routed:
+        return routed
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "response_metadata", None) or {}
+            if metadata.get("routed_model"):
+                return metadata["routed_model"]
+    return None
+
+
+def _token_usage(response) -> dict:
+    """Extract token counts from an LLMResult, whichever way the provider reported them."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if not usage:
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    usage = {"prompt_tokens": metadata.get("input_tokens"),
+                             "completion_tokens": metadata.get("output_tokens")}
+    return {key: usage[key] for key in ("prompt_tokens", "completion_tokens") if usage.get(key) is not None}
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Return the process-wide Tracer."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+def span(stage: str, name: str = None, **attrs):
+    """Time a block as a span on the process-wide tracer."""
+    return get_tracer().span(stage, name, **attrs)
+
+
+if __name__ == "__main__":
+    # Aggregate a trace file: python H_tracing.py [traces.jsonl]
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("TRACE_FILE", "traces.jsonl")
+    with open(path, encoding="utf-8") as f:
+        stats = aggregate(json.loads(line) for line in f if line.strip())
+    print(f"{'stage':<16}{'count':>8}{'p50 s':>10}{'p95 s':>10}{'max s':>10}")
+    for stage, entry in stats.items():
+        print(f"{stage:<16}{entry['count']:>8}{entry['p50']:>10.3f}{entry['p95']:>10.3f}{entry['max']:>10.3f}")
@@ -0,0 +1,88 @@
+import os
+import hmac
+import time
+import sqlite3
+import logging
+import threading
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class UserStore:
+    """
+    SQLite-backed user accounts with an indexed username lookup.
+
+    The database runs in WAL mode so logins never wait for a registration,
+    and a registration is a single INSERT, so two users racing for the same
+    name cannot both succeed or corrupt the store.
+    """
+
+    def __init__(self, path: str = None, legacy_path: str = None):
+        """
+        Open (and create if needed) the store.
+
+        :param path: The SQLite file (``USER_STORE_PATH``, default ``users.sqlite3``).
+        :param legacy_path: A ``username,hash`` text file to import once; it is renamed
+                            to ``<name>.migrated`` afterwards.
+        """
+        self.path = path or os.getenv("USER_STORE_PATH", "users.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        if legacy_path and os.path.exists(legacy_path):
+            self.migrate(legacy_path)
+
+    def migrate(self, legacy_path: str) -> int:
+        """
+        Import users from a ``username,hash`` text file, keeping existing accounts.
+
+        :return: The number of users imported.
+        """
+        rows = []
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split(",")
+                if len(parts) == 2 and parts[0]:
+                    rows.append((parts[0], parts[1], time.time()))
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO users (username, password_hash, created_at) VALUES (?, ?, ?)", rows
+            )
+            imported = self._conn.total_changes - before
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        logging.info(f"Imported {imported} users from {legacy_path}.")
+        return imported
+
+    def register(self, username: str, password_hash: str) -> bool:
+        """Create an account; return False if the username is taken."""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
+                    (username, password_hash, time.time()),
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def verify(self, username: str, password_hash: str) -> bool:
+        """Return True if ``username`` exists and its stored hash matches."""
+        with self._lock:
+            row = self._conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None and hmac.compare_digest(row[0], password_hash)
+
+    def exists(self, username: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
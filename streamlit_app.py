@@ -1,7 +1,15 @@
 import streamlit as st
 import time
 from datetime import datetime
-from H_supervisor import TyphoonAgent
+from H_agentpool import AgentPool
+from H_tracing import get_tracer, new_trace_id
+from H_llmclient import get_llm_factory
+from H_modelrouter import get_model_router
+from H_resultcache import get_result_cache
+from H_userstore import UserStore
+from H_chatstore import ChatStore
+from H_chatview import inject_css, render_chat, render_chat_log, visible_sessions, render_older_sessions_button
+from H_ingest import get_ingestor
 from dotenv import load_dotenv
 
 import os
@@ -10,66 +18,56 @@ import hashlib  # สำหรับ hash password
 # กำหนด path สำหรับเก็บไฟล์และข้อมูลผู้ใช้
 BASE_FOLDER = "user_data"
 UPLOAD_FOLDER = "uploads"
-USER_DATA_FILE = "users.txt"  # ไฟล์เก็บข้อมูลผู้ใช้
+USER_DATA_FILE = "users.txt"  # ไฟล์ผู้ใช้แบบเดิม จะถูกย้ายเข้า user store อัตโนมัติ
 os.makedirs(BASE_FOLDER, exist_ok=True)
 
-# ตรวจสอบว่ามีไฟล์ users.txt หรือยัง ถ้าไม่มีให้สร้าง
-if not os.path.exists(USER_DATA_FILE):
-    with open(USER_DATA_FILE, "w") as f:
-        pass  # สร้างไฟล์เปล่า
+# user store (SQLite) ที่ใช้ร่วมกันทั้ง process
+@st.cache_resource
+def get_user_store():
+    return UserStore(legacy_path=USER_DATA_FILE)
+
+# ประวัติการสนทนา (SQLite แบบ append-only) ที่ใช้ร่วมกันทั้ง process
+@st.cache_resource
+def get_chat_store():
+    return ChatStore()
+
+# pool ของ agent ที่ใช้ร่วมกันทั้ง process เพื่อไม่ต้องสร้าง agent ใหม่ทุกข้อความ
+@st.cache_resource
+def get_agent_pool():
+    return AgentPool()
 
 # ตั้งค่า session_state
-if "chat_sessions" not in st.session_state:
-    st.session_state.chat_sessions = []
 if "current_session" not in st.session_state:
     st.session_state.current_session = None
 if "username" not in st.session_state:
     st.session_state.username = None
-if "uploaded_files" not in st.session_state:
-    st.session_state.uploaded_files = {}
+if "upload_jobs" not in st.session_state:
+    st.session_state.upload_jobs = {}
 
 # ฟังก์ชันสำหรับจัดการข้อมูลผู้ใช้
 def get_user_folder(username):
     return os.path.join(BASE_FOLDER, username)
 
-def save_user_data(username, data):
-    user_folder = get_user_folder(username)
-    os.makedirs(user_folder, exist_ok=True)
-    with open(os.path.join(user_folder, "data.json"), "w") as f:
-        json.dump(data, f)
-
-def load_user_data(username):
-    user_folder = get_user_folder(username)
-    data_file = os.path.join(user_folder, "data.json")
-    if os.path.exists(data_file):
-        with open(data_file, "r") as f:
-            return json.load(f)
-    return {"chat_sessions": [], "uploaded_files": {}}
-
-def save_current_session():
-    if st.session_state.current_session is not None:
-        user_data = load_user_data(st.session_state.username)
-        user_data["chat_sessions"] = st.session_state.chat_sessions
-        user_data["uploaded_files"] = st.session_state.uploaded_files
-        save_user_data(st.session_state.username, user_data)
+# ย้ายประวัติจาก data.json แบบเดิมเข้า chat store (ครั้งเดียวต่อผู้ใช้)
+def migrate_user_history(username):
+    get_chat_store().migrate(username, os.path.join(get_user_folder(username), "data.json"))
 
-def load_user_sessions():
-    user_data = load_user_data(st.session_state.username)
-    st.session_state.chat_sessions = user_data.get("chat_sessions", [])
-    st.session_state.uploaded_files = user_data.get("uploaded_files", {})
 
+# คืน memory ของ agent ที่ผูกกับเซสชันปัจจุบัน (ตอนเปลี่ยนเซสชัน)
+def release_session_memory():
+    if st.session_state.current_session is not None:
+        get_agent_pool().release_session(st.session_state.username, st.session_state.current_session)
 
 # ฟังก์ชันเริ่มต้นเซสชันใหม่
 def start_new_session():
+    release_session_memory()
     st.session_state.current_session = None
 
-# ฟังก์ชันเพิ่มข้อความในเซสชันปัจจุบัน
+# ฟังก์ชันเพิ่มข้อความในเซสชันปัจจุบัน (บันทึกเฉพาะข้อความใหม่)
 def add_to_current_session(role, content):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     if st.session_state.current_session is not None:
-        st.session_state.chat_sessions[st.session_state.current_session]["history"].append(
-            {"role": role, "content": content, "timestamp": timestamp}
-        )
+        get_chat_store().append_message(st.session_state.current_session, role, content, timestamp)
 
 # ฟังก์ชัน hash password
 def hash_password(password):
@@ -88,14 +86,9 @@ def register():
         else:
             hashed_password = hash_password(new_password)
             try:
-                with open(USER_DATA_FILE, "r") as f:
-                    for line in f:
-                        user, _ = line.strip().split(",")
-                        if user == new_username:
-                            st.error("Username already exists.")
-                            return
-                with open(USER_DATA_FILE, "a") as f:
-                    f.write(f"{new_username},{hashed_password}\n")
+                if not get_user_store().register(new_username, hashed_password):
+                    st.error("Username already exists.")
+                    return
                 st.success("Registration successful! Please login.")
             except Exception as e:
                 st.error(f"An error occurred during registration: {e}")
@@ -107,16 +100,11 @@ def login():
     if st.button("Login"):
         hashed_password = hash_password(password)
         try:
-            with open(USER_DATA_FILE, "r") as f:
-                for line in f:
-                    user, stored_hash = line.strip().split(",")
-                    if user == username and stored_hash == hashed_password:
-                        st.session_state.username = username
-                        st.success("Login successful!")
-                        return
+            if get_user_store().verify(username, hashed_password):
+                st.session_state.username = username
+                st.success("Login successful!")
+                return
             st.error("Invalid username or password.")
-        except FileNotFoundError:
-            st.error("No user data found. Please register.")
         except Exception as e:
             st.error(f"An error occurred during login: {e}")
 
@@ -130,21 +118,23 @@ if not st.session_state.username:
     st.stop()
 
 # ส่วนของ app หลังจาก login
+if st.session_state.get("history_migrated") != st.session_state.username:
+    migrate_user_history(st.session_state.username)
+    st.session_state.history_migrated = st.session_state.username
+
 st.sidebar.write(f"Logged in as: {st.session_state.username}")
 if st.sidebar.button("Logout"):
+    get_agent_pool().release_user(st.session_state.username)
     st.session_state.username = None
+    st.session_state.current_session = None
     st.experimental_rerun()
     
 # Sidebar สำหรับการตั้งค่า
 with st.sidebar.expander("⚙️ Settings", expanded=True):
-    model_options = {
-        "gpt-4o-mini": "GPT-4o Mini",
-        "llama-3.1-405b": "Llama 3.1 405B",
-        "llama-3.2-3b": "Llama 3.2 3B",
-        "Gemini Pro 1.5": "Gemini Pro 1.5",
-    }
-    model = st.selectbox("Choose your AI Model:", options=list(model_options.keys()))
-    temperature = st.slider("Set Temperature:", min_value=0.0, max_value=2.0, value=1.0)
+    # รายชื่อโมเดลมาจาก catalog ของ router (ตั้งค่าเพิ่มได้ผ่าน MODEL_CATALOG)
+    router = get_model_router()
+    model = st.selectbox("Choose your AI Model:", options=router.models(), format_func=router.label)
+    temperature = st.slider("Set Temperature:", min_value=0.0, max_value=2.0, value=0.1)
     
     api_key = st.text_input("API Key", type="password")
     st.session_state["api_key"] = api_key
@@ -153,94 +143,109 @@ with st.sidebar.expander("⚙️ Settings", expanded=True):
 st.sidebar.markdown("### 📂 File Upload")
 uploaded_files = st.sidebar.file_uploader("Choose files", accept_multiple_files=True)
 
-# ฟังก์ชันสำหรับบันทึกไฟล์
-def save_uploaded_file(username, uploaded_file):
-    user_folder = get_user_folder(username)
-    upload_folder = os.path.join(user_folder, "uploads")
-    os.makedirs(upload_folder, exist_ok=True)
-    
-    file_path = os.path.join(upload_folder, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    return file_path
-
-# ฟังก์ชันโหลดไฟล์ที่เกี่ยวข้องกับผู้ใช้เมื่อเริ่มต้นเซสชัน
-def load_user_files(username):
-    user_folder = get_user_folder(username)
-    upload_folder = os.path.join(user_folder, "uploads")
-    os.makedirs(upload_folder, exist_ok=True)  # สร้างโฟลเดอร์ถ้ายังไม่มี
-    return [
-        os.path.join(upload_folder, file_name) for file_name in os.listdir(upload_folder)
-    ]
-
-# ส่วนจัดการไฟล์ใน Sidebar
-if uploaded_files:
-    if st.session_state.current_session is not None:
-        if st.session_state.current_session not in st.session_state.uploaded_files:
-            st.session_state.uploaded_files[st.session_state.current_session] = []
-
-        for uploaded_file in uploaded_files:
-            # บันทึกไฟล์ในโฟลเดอร์ของผู้ใช้
-            file_path = save_uploaded_file(st.session_state.username, uploaded_file)
-            st.session_state.uploaded_files[st.session_state.current_session].append(file_path)
+# ส่งไฟล์ที่อัปโหลดเข้า ingest store (hash ครั้งเดียวต่อไฟล์ ไฟล์ซ้ำจะไม่ถูกเขียนหรือแปลงใหม่)
+def ingest_upload(uploaded_file):
+    upload_id = (getattr(uploaded_file, "file_id", None) or uploaded_file.name, uploaded_file.size)
+    job = st.session_state.upload_jobs.get(upload_id)
+    if job is None:
+        job = get_ingestor().ingest(st.session_state.username, uploaded_file.name, uploaded_file.getbuffer())
+        st.session_state.upload_jobs[upload_id] = job
+    return job
+
+# แสดงความคืบหน้าการเตรียมไฟล์ใน Sidebar
+def show_ingest_progress(jobs):
+    for job in jobs:
+        if job.status == "failed":
+            st.error(f"{job.name}: {job.error}")
+        elif job.status == "ready":
+            st.progress(1.0, text=f"{job.name}: ready ({job.rows:,} rows)")
+        else:
+            st.progress(job.progress, text=f"{job.name}: {job.status}...")
 
-        # แสดงไฟล์ที่อัปโหลดใน Sidebar
-        #st.sidebar.markdown("#### Uploaded Files:")
-        #for file_path in st.session_state.uploaded_files[st.session_state.current_session]:
-        #    file_name = os.path.basename(file_path)
-        #    st.sidebar.write(f"- {file_name}")
+# ระหว่างที่ยังเตรียมไฟล์ไม่เสร็จ refresh เฉพาะส่วนนี้ทุกวินาที แล้ว rerun ทั้งหน้าเมื่อเสร็จ
+@st.fragment(run_every=1)
+def watch_ingest_progress(jobs):
+    show_ingest_progress(jobs)
+    if all(job.done for job in jobs):
+        st.rerun()
 
 uploaded_file_paths = {}
+uploads_pending = False
 if uploaded_files:
-    st.sidebar.markdown("### 📂 File Upload")
-    for file in uploaded_files:
-        st.sidebar.write(f"- {file.name}")
-        # สร้างพาธชั่วคราวสำหรับไฟล์ที่อัปโหลด
-        with open(f"./{file.name}", "wb") as f:
-            f.write(file.getbuffer())
-        uploaded_file_paths[file.name] = f"./{file.name}"
+    upload_jobs = []
+    for uploaded_file in uploaded_files:
+        try:
+            upload_jobs.append(ingest_upload(uploaded_file))
+        except ValueError as e:
+            st.sidebar.error(str(e))
+    # ใช้เฉพาะไฟล์ที่เตรียมเสร็จแล้ว ไฟล์ที่ยังแปลงอยู่จะถูกเพิ่มเมื่อ rerun หลังเสร็จ
+    uploaded_file_paths = {job.name: job.path for job in upload_jobs if job.status == "ready"}
+    uploads_pending = not all(job.done for job in upload_jobs)
+    with st.sidebar:
+        if not uploads_pending:
+            show_ingest_progress(upload_jobs)
+        else:
+            watch_ingest_progress(upload_jobs)
 
 
 # Sidebar สำหรับจัดการประวัติการสนทนา
 st.sidebar.title("Chat History")
 
-# ปุ่มเริ่มต้นเซสชันใหม่
+# ปุ่มเริ่มต้นเซสชันใหม่ (title ถูกตั้งจากข้อความแรกตอนบันทึกอยู่แล้ว)
 if st.sidebar.button("Start New Chat"):
-    if st.session_state.current_session is not None:
-        # บันทึกเซสชันเก่าด้วย title จากข้อความแรก
-        if len(st.session_state.chat_sessions[st.session_state.current_session]["history"]) > 0:
-            first_message = st.session_state.chat_sessions[st.session_state.current_session]["history"][0]["content"]
-            st.session_state.chat_sessions[st.session_state.current_session]["title"] = first_message
     start_new_session()
 
-# แสดงรายการเซสชันใน Sidebar โดยแชทใหม่อยู่ข้างบน
-if st.session_state.chat_sessions:
-    for idx, session in reversed(list(enumerate(st.session_state.chat_sessions))):
-        title = session.get("title", f"Session {idx + 1}")
-        if st.sidebar.button(title, key=f"session_{idx}"):
-            st.session_state.current_session = idx
-  
+# แสดงรายการเซสชันใน Sidebar โดยแชทใหม่อยู่ข้างบน (โหลดเฉพาะ title ทีละหน้า พร้อมปุ่มโหลดแชทเก่า)
+for session in visible_sessions(get_chat_store(), st.session_state.username):
+    title = session["title"] or f"Session {session['id']}"
+    if st.sidebar.button(title, key=f"session_{session['id']}") and session["id"] != st.session_state.current_session:
+        release_session_memory()
+        st.session_state.current_session = session["id"]
+with st.sidebar:
+    render_older_sessions_button(get_chat_store(), st.session_state.username)
+
 def response_generator():
     load_dotenv()
     
     file_paths = uploaded_file_paths
 
-    if not file_paths:
-        st.error("Please upload files to proceed.")
-        return
-    
-    agent = TyphoonAgent(
-        temperature=0.1,
-        base_url="https://api.opentyphoon.ai/v1",
-        model_name="typhoon-v1.5x-70b-instruct", 
-        dataset_paths=file_paths
+    agent = get_agent_pool().acquire(
+        dataset_paths=file_paths,
+        model_name=model,
+        temperature=temperature,
+        base_url=router.base_url,
+        user=st.session_state.username,
+        session=st.session_state.current_session,
+        router=router,
     )
 
-    response = agent.agent_executor.invoke({"input": user_input})
-    return response['output']
+    # แสดงขั้นตอนการทำงานของ agent และคำตอบแบบ streaming ระหว่างรอ
+    with chat_container:
+        status = st.status("Thinking...", expanded=False)
+        answer = st.empty()
+
+    # เก็บ trace id ของรอบนี้ไว้แสดงในแผง Performance
+    trace_id = new_trace_id()
+    st.session_state.last_trace_id = trace_id
+
+    streamed = ""
+    output = None
+    for kind, text in agent.stream_query(user_input, trace_id):
+        if kind == "step":
+            status.write(text)
+        elif kind == "token":
+            streamed += text
+            answer.markdown(streamed)
+        elif kind == "final":
+            output = text
+
+    status.update(label="Done", state="complete")
+    answer.empty()
+    return output if output is not None else streamed
 
 
 st.title("Chat Application")
+inject_css()  # CSS ของข้อความแชทส่งครั้งเดียวต่อการ render
 
 # Layout สำหรับการสนทนาและ Log
 col1, col2 = st.columns([175, 100])  # เพิ่มสัดส่วนของคอลัมน์ด้านขวา
@@ -251,11 +256,15 @@ with col1:
     chat_container = st.container()  # พื้นที่แสดงข้อความ
     user_input = st.chat_input("Type your message here...")
 
-    if user_input:
+    # ถ้ายังไม่มีไฟล์พร้อมใช้ แจ้งผู้ใช้โดยไม่บันทึกข้อความรอบนี้ลงประวัติ
+    if user_input and uploads_pending:
+        st.info("Your datasets are still being prepared. Please ask again once they are ready.")
+    elif user_input and not uploaded_file_paths:
+        st.error("Please upload files to proceed.")
+    elif user_input:
         # หากไม่มีเซสชัน เริ่มเซสชันใหม่
         if st.session_state.current_session is None:
-            st.session_state.chat_sessions.append({"title": "", "history": []})
-            st.session_state.current_session = len(st.session_state.chat_sessions) - 1
+            st.session_state.current_session = get_chat_store().create_session(st.session_state.username)
 
         # เพิ่มข้อความใหม่ในเซสชันปัจจุบัน
         add_to_current_session("user", user_input)
@@ -264,48 +273,66 @@ with col1:
         response = response_generator()
         add_to_current_session("assistant", response)
 
-    # แสดงข้อความใน Chat
+    # แสดงข้อความใน Chat (เฉพาะช่วงล่าสุด พร้อมปุ่มโหลดข้อความเก่า)
 with chat_container:
     if st.session_state.current_session is not None:
-        session = st.session_state.chat_sessions[st.session_state.current_session]
-        st.subheader(f"Session: {session.get('title', 'New Chat')}")
-        for chat in session["history"]:
-            message_alignment = "flex-end" if chat["role"] == "user" else "flex-start"
-            st.markdown(
-                f"""
-                <style>
-                .message {{
-                    padding: 10px;
-                    border-radius: 8px;
-                    max-width: 80%;
-                    word-wrap: break-word;
-                    background-color: var(--background-color);
-                    color: invert(var(--background-color));
-                    transition: background-color 0.3s ease, color 0.3s ease;
-                }}
-                </style>
-                <div style="display: flex; justify-content: {message_alignment}; margin-bottom: 10px;">
-                    <div class="message">
-                        {chat['content']}
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+        render_chat(get_chat_store(), st.session_state.current_session)
 
 
 
 # คอลัมน์สำหรับ Log
 with col2:
     with st.expander("📝 Chat Log", expanded=False):
-        if st.session_state.chat_sessions:
-            for idx, session in reversed(list(enumerate(st.session_state.chat_sessions))):
-                title = session.get("title", f"Session {idx + 1}")
-                st.markdown(f"**{title}**")
-                for chat in session["history"]:
-                    st.write(f"{chat['timestamp']} | {chat['role'].capitalize()}: {chat['content']}")
+        render_chat_log(get_chat_store(), st.session_state.username)
+
+    # แผงแสดงเวลาที่ใช้ในแต่ละขั้นตอน (p50/p95) และรายละเอียดของรอบล่าสุด
+    with st.expander("⏱️ Performance", expanded=False):
+        tracer = get_tracer()
+        last_trace_id = st.session_state.get("last_trace_id")
+        turn_spans = tracer.spans(last_trace_id) if last_trace_id else []
+        if turn_spans:
+            st.markdown("**Last turn**")
+            st.dataframe(
+                [
+                    {
+                        "stage": span["stage"],
+                        "name": span["name"],
+                        "seconds": round(span["duration"], 3),
+                        "prompt tokens": span["attrs"].get("prompt_tokens"),
+                        "completion tokens": span["attrs"].get("completion_tokens"),
+                    }
+                    for span in sorted(turn_spans, key=lambda span: span["start"])
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+        stage_stats = tracer.stats()
+        if stage_stats:
+            st.markdown("**By stage (seconds)**")
+            st.dataframe(
+                [{"stage": stage, **entry} for stage, entry in stage_stats.items()],
+                hide_index=True,
+                use_container_width=True,
+            )
         else:
-            st.write("No chat logs available.")
+            st.write("No performance data yet.")
+        router_stats = router.stats()
+        if router_stats:
+            st.markdown("**Model latency (seconds)**")
+            st.dataframe(router_stats, hide_index=True, use_container_width=True)
+        result_cache = get_result_cache()
+        if result_cache is not None:
+            st.caption("Result cache: {entries} entries, {bytes} bytes, {hits} hits / {misses} misses".format(
+                **result_cache.stats()))
+        # คิวของ rate limiter และการ retry ต่อ endpoint/API key
+        client_stats = get_llm_factory().stats()
+        if client_stats:
+            st.markdown("**LLM endpoints**")
+            st.dataframe(
+                [{"endpoint": key, **entry} for key, entry in client_stats.items()],
+                hide_index=True,
+                use_container_width=True,
+            )
 
 # ปุ่มอัปโหลดไฟล์ทางซ้ายล่างสุด
 st.markdown(